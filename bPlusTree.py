@@ -0,0 +1,428 @@
+import bisect
+from bookTree import BookTree
+
+# The most entries a leaf, or children an internal node, may hold before it is split.
+ORDER = 64
+
+
+class Entry:
+    # One book in a leaf. Like a red-black tree Node, it holds the book as its key.
+    __slots__ = ("key", "value")
+
+    def __init__(self, key, value=None):
+        self.key = key
+        self.value = value
+
+
+class Leaf:
+    __slots__ = ("ids", "entries", "prev", "next")
+
+    def __init__(self):
+        self.ids = []  # Sorted book IDs, so a leaf is searched with bisect over plain integers.
+        self.entries = []  # The Entry for each ID.
+        self.prev = None  # Neighbouring leaves, for scanning a range in either direction.
+        self.next = None
+
+
+class Internal:
+    __slots__ = ("ids", "children", "counts")
+
+    def __init__(self):
+        # Every ID under children[i] is below ids[i], and every ID under children[i + 1] is at least ids[i].
+        self.ids = []
+        self.children = []
+        self.counts = []  # Number of entries under each child, for rank and select.
+
+
+class BPlusTree(BookTree):
+    """
+    A B+tree of books keyed by book_id, usable as GatorLibrary's book_tree in place of a
+    RedBlackTree. It offers the same methods (put, get, delete, floor, ceiling, iter_range, rank,
+    select, count_range, bulk_insert, bulk_load, split), and lookups return an Entry whose key
+    is the book, just as a red-black tree returns a Node.
+
+    Nodes are wide: each holds up to ORDER book IDs in a Python list, so a search is a handful of
+    bisects over contiguous integers rather than one attribute lookup per level of a binary tree,
+    and the tree is only three or four levels deep for millions of books. The leaves are linked
+    in both directions, so a range scan walks along them without going back up the tree. Nodes
+    that fall below a quarter full after a delete are merged with a neighbour, or take entries
+    from it when the two would not fit in one node.
+
+    No rotations or color flips happen here, so get_color_flips() returns None.
+    """
+
+    def __init__(self, order=ORDER):
+        # Splitting and merging need room for at least two children on each side.
+        if order < 3:
+            raise ValueError("order must be at least 3")
+        self.order = order
+        self.root = Leaf()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _new_tree(self):
+        return BPlusTree(self.order)
+
+    def _find_leaf(self, key):
+        # returns the leaf whose range of IDs covers the given ID.
+        node = self.root
+        while node.__class__ is Internal:
+            node = node.children[bisect.bisect_right(node.ids, key)]
+        return node
+
+    def get(self, key):
+        # returns the entry for the given book ID, or None.
+        leaf = self._find_leaf(key)
+        idx = bisect.bisect_left(leaf.ids, key)
+        if idx < len(leaf.ids) and leaf.ids[idx] == key:
+            return leaf.entries[idx]
+        return None
+
+    # Entries are never shared, so callers may change the book of the entry they are given.
+    get_for_update = get
+
+    def put(self, key, value=None):
+        """
+        inserts the key (a book) with the given value. If its book_id is already present, the
+        existing key is kept and its value updated, as in RedBlackTree.put.
+        """
+        book_id = key.book_id
+        path = []
+        node = self.root
+        while node.__class__ is Internal:
+            idx = bisect.bisect_right(node.ids, book_id)
+            path.append((node, idx))
+            node = node.children[idx]
+        idx = bisect.bisect_left(node.ids, book_id)
+        if idx < len(node.ids) and node.ids[idx] == book_id:
+            node.entries[idx].value = value
+            return
+        node.ids.insert(idx, book_id)
+        node.entries.insert(idx, Entry(key, value))
+        self.size += 1
+        for parent, child_idx in path:
+            parent.counts[child_idx] += 1
+        if len(node.ids) > self.order:
+            self._split_leaf(path, node)
+
+    def _split_leaf(self, path, leaf):
+        # Moves the upper half of an overfull leaf into a new leaf after it.
+        half = len(leaf.ids) // 2
+        right = Leaf()
+        right.ids = leaf.ids[half:]
+        right.entries = leaf.entries[half:]
+        del leaf.ids[half:]
+        del leaf.entries[half:]
+        right.next = leaf.next
+        if leaf.next:
+            leaf.next.prev = right
+        leaf.next = right
+        right.prev = leaf
+        self._add_child(path, leaf, right, right.ids[0], len(right.ids))
+
+    def _add_child(self, path, left, right, separator, right_count):
+        # Adds right, just split off from left, to left's parent, splitting parents as needed.
+        while path:
+            parent, idx = path.pop()
+            parent.ids.insert(idx, separator)
+            parent.children.insert(idx + 1, right)
+            parent.counts[idx] -= right_count
+            parent.counts.insert(idx + 1, right_count)
+            if len(parent.children) <= self.order:
+                return
+            # Split the parent too, passing its middle ID up to the next level.
+            half = len(parent.children) // 2
+            sibling = Internal()
+            sibling.children = parent.children[half:]
+            sibling.counts = parent.counts[half:]
+            sibling.ids = parent.ids[half:]
+            separator = parent.ids[half - 1]
+            del parent.children[half:]
+            del parent.counts[half:]
+            del parent.ids[half - 1:]
+            left, right, right_count = parent, sibling, sum(sibling.counts)
+        # The root itself was split, so the tree grows a level.
+        root = Internal()
+        root.ids = [separator]
+        root.children = [left, right]
+        root.counts = [self.size - right_count, right_count]
+        self.root = root
+
+    def delete(self, key):
+        # removes the book with the given ID from the tree, if present.
+        path = []
+        node = self.root
+        while node.__class__ is Internal:
+            idx = bisect.bisect_right(node.ids, key)
+            path.append((node, idx))
+            node = node.children[idx]
+        idx = bisect.bisect_left(node.ids, key)
+        if idx == len(node.ids) or node.ids[idx] != key:
+            return
+        del node.ids[idx]
+        del node.entries[idx]
+        self.size -= 1
+        for parent, child_idx in path:
+            parent.counts[child_idx] -= 1
+        self._merge_path(path, node)
+
+    def _merge_path(self, path, node):
+        """
+        Fixes up a node that a delete has left too small, that is a leaf with fewer than a quarter
+        of ORDER entries or an internal node with fewer than a quarter of ORDER children (and never
+        an empty leaf or an internal node with one child). The node is merged with a neighbour if
+        the two fit in one node, and otherwise takes entries from it so that both end up at least
+        half full. A merge takes a child from the parent, so the parent is checked in turn.
+        """
+        min_entries = max(1, self.order // 4)
+        min_children = max(2, self.order // 4)
+        while path:
+            parent, idx = path.pop()
+            if node.__class__ is Leaf:
+                if len(node.ids) >= min_entries:
+                    break
+            elif len(node.children) >= min_children:
+                break
+            # Pair the node with its left neighbour if there is one, otherwise with its right one.
+            if idx > 0:
+                idx -= 1
+            left = parent.children[idx]
+            right = parent.children[idx + 1]
+            if left.__class__ is Leaf:
+                ids = left.ids + right.ids
+                entries = left.entries + right.entries
+                if len(ids) > self.order:
+                    half = len(ids) // 2
+                    left.ids, right.ids = ids[:half], ids[half:]
+                    left.entries, right.entries = entries[:half], entries[half:]
+                    parent.ids[idx] = right.ids[0]
+                    parent.counts[idx], parent.counts[idx + 1] = half, len(ids) - half
+                    break
+                left.ids = ids
+                left.entries = entries
+                left.next = right.next
+                if right.next:
+                    right.next.prev = left
+            else:
+                # The separator between the two comes down from the parent.
+                ids = left.ids + [parent.ids[idx]] + right.ids
+                children = left.children + right.children
+                counts = left.counts + right.counts
+                if len(children) > self.order:
+                    half = len(children) // 2
+                    left.children, right.children = children[:half], children[half:]
+                    left.counts, right.counts = counts[:half], counts[half:]
+                    left.ids, right.ids = ids[:half - 1], ids[half:]
+                    parent.ids[idx] = ids[half - 1]
+                    parent.counts[idx], parent.counts[idx + 1] = sum(left.counts), sum(right.counts)
+                    break
+                left.ids = ids
+                left.children = children
+                left.counts = counts
+            del parent.ids[idx]
+            del parent.children[idx + 1]
+            parent.counts[idx] += parent.counts.pop(idx + 1)
+            node = parent
+        # A root with a single child is no longer needed.
+        while self.root.__class__ is Internal and len(self.root.children) == 1:
+            self.root = self.root.children[0]
+
+    def floor(self, key):
+        # returns the entry with the largest ID less than or equal to the given ID, or None.
+        leaf = self._find_leaf(key)
+        idx = bisect.bisect_right(leaf.ids, key) - 1
+        if idx >= 0:
+            return leaf.entries[idx]
+        leaf = leaf.prev
+        while leaf and not leaf.ids:
+            leaf = leaf.prev
+        return leaf.entries[-1] if leaf else None
+
+    def ceiling(self, key):
+        # returns the entry with the smallest ID greater than or equal to the given ID, or None.
+        leaf = self._find_leaf(key)
+        idx = bisect.bisect_left(leaf.ids, key)
+        if idx < len(leaf.ids):
+            return leaf.entries[idx]
+        leaf = leaf.next
+        while leaf and not leaf.ids:
+            leaf = leaf.next
+        return leaf.entries[0] if leaf else None
+
+    def iter_range(self, start_key, end_key, reverse=False, limit=None):
+        """
+        Yields the entries with IDs from start_key to end_key (inclusive), in increasing order of
+        book_id, or decreasing order if reverse is set, stopping after limit entries if a limit
+        is given. Each leaf's share of the range is sliced out in one go. The tree must not be
+        modified while the iteration is in progress.
+        """
+        if limit is not None and limit <= 0:
+            return
+        if not reverse:
+            leaf = self._find_leaf(start_key)
+            start = bisect.bisect_left(leaf.ids, start_key)
+            while leaf:
+                stop = bisect.bisect_right(leaf.ids, end_key)
+                if limit is not None and stop - start >= limit:
+                    yield from leaf.entries[start:start + limit]
+                    return
+                yield from leaf.entries[start:stop]
+                if stop < len(leaf.ids):
+                    return
+                if limit is not None:
+                    limit -= stop - start
+                leaf = leaf.next
+                start = 0
+        else:
+            leaf = self._find_leaf(end_key)
+            stop = bisect.bisect_right(leaf.ids, end_key)
+            while leaf:
+                start = bisect.bisect_left(leaf.ids, start_key)
+                if limit is not None and stop - start >= limit:
+                    yield from reversed(leaf.entries[stop - limit:stop])
+                    return
+                yield from reversed(leaf.entries[start:stop])
+                if start > 0:
+                    return
+                if limit is not None:
+                    limit -= stop - start
+                leaf = leaf.prev
+                stop = len(leaf.ids) if leaf else 0
+
+    def rank(self, key):
+        # returns the number of books in the tree with IDs less than the given ID.
+        rank = 0
+        node = self.root
+        while node.__class__ is Internal:
+            idx = bisect.bisect_right(node.ids, key)
+            rank += sum(node.counts[:idx])
+            node = node.children[idx]
+        return rank + bisect.bisect_left(node.ids, key)
+
+    def select(self, index):
+        # returns the entry with the given zero-based position in ID order, or None if out of range.
+        if index < 0 or index >= self.size:
+            return None
+        node = self.root
+        while node.__class__ is Internal:
+            for idx, count in enumerate(node.counts):
+                if index < count:
+                    break
+                index -= count
+            node = node.children[idx]
+        return node.entries[index]
+
+    def bulk_load(self, keys):
+        """
+        Replaces the contents of the tree with the given keys, which must already be sorted by
+        book_id with no duplicates. The tree is built bottom-up in O(n), with nodes left three
+        quarters full so that later inserts do not split them straight away.
+        """
+        fill = max(3, self.order * 3 // 4)
+        leaves = []
+        for start in range(0, len(keys), fill):
+            leaf = Leaf()
+            leaf.ids = [key.book_id for key in keys[start:start + fill]]
+            leaf.entries = [Entry(key) for key in keys[start:start + fill]]
+            if leaves:
+                leaves[-1].next = leaf
+                leaf.prev = leaves[-1]
+            leaves.append(leaf)
+        self.size = len(keys)
+        if not leaves:
+            self.root = Leaf()
+            return
+
+        # Build each level from the one below, remembering the first ID and size of each node.
+        level = leaves
+        first_ids = [leaf.ids[0] for leaf in leaves]
+        counts = [len(leaf.ids) for leaf in leaves]
+        while len(level) > 1:
+            parents = []
+            parent_first_ids = []
+            parent_counts = []
+            for start in range(0, len(level), fill):
+                node = Internal()
+                node.children = level[start:start + fill]
+                node.ids = first_ids[start + 1:start + fill]
+                node.counts = counts[start:start + fill]
+                parents.append(node)
+                parent_first_ids.append(first_ids[start])
+                parent_counts.append(sum(node.counts))
+            # A last node with a single child would be no use, so give it its neighbour's last child.
+            if len(parents) > 1 and len(parents[-1].children) == 1:
+                previous, last = parents[-2], parents[-1]
+                last.children.insert(0, previous.children.pop())
+                last.counts.insert(0, previous.counts.pop())
+                last.ids.insert(0, parent_first_ids[-1])
+                parent_first_ids[-1] = previous.ids.pop()
+                parent_counts[-2] -= last.counts[0]
+                parent_counts[-1] += last.counts[0]
+            level, first_ids, counts = parents, parent_first_ids, parent_counts
+        self.root = level[0]
+
+    def height(self):
+        # returns the number of levels in the tree.
+        height = 1 if self.size else 0
+        node = self.root
+        while node.__class__ is Internal:
+            height += 1
+            node = node.children[0]
+        return height
+
+    def get_color_flips(self):
+        # Only the red-black tree counts color flips.
+        return None
+
+    def check_invariants(self):
+        """
+        Returns True if the tree is a valid B+tree: IDs are sorted and within the bounds set by
+        the separators above them, every node's counts match its children, no node is overfull,
+        only the root leaf may be empty, every internal node has at least two children, all leaves
+        are at the same depth, and the leaf links visit every entry in order.
+        """
+        leaf_depths = set()
+        leaves = []
+        stack = [(self.root, float('-inf'), float('inf'), 1)]
+        while stack:
+            node, low, high, depth = stack.pop()
+            if node.ids != sorted(node.ids) or any(not low <= book_id < high for book_id in node.ids):
+                return False
+            if node.__class__ is Leaf:
+                if len(node.ids) > self.order or len(node.ids) != len(node.entries):
+                    return False
+                if not node.ids and node is not self.root:
+                    return False
+                if any(entry.key.book_id != book_id for entry, book_id in zip(node.entries, node.ids)):
+                    return False
+                leaf_depths.add(depth)
+                leaves.append((low, node))
+                continue
+            if not 2 <= len(node.children) <= self.order or len(node.children) != len(node.ids) + 1:
+                return False
+            bounds = [low] + node.ids + [high]
+            for idx, child in enumerate(node.children):
+                if node.counts[idx] != self._count(child):
+                    return False
+                stack.append((child, bounds[idx], bounds[idx + 1], depth + 1))
+        if len(leaf_depths) > 1:
+            return False
+        leaves.sort(key=lambda item: item[0])
+        linked = []
+        leaf = leaves[0][1]
+        if leaf.prev is not None:
+            return False
+        while leaf:
+            if leaf.next and leaf.next.prev is not leaf:
+                return False
+            linked.append(leaf)
+            leaf = leaf.next
+        return linked == [leaf for _, leaf in leaves] and sum(len(leaf.ids) for leaf in linked) == self.size
+
+    def _count(self, node):
+        # returns the number of entries under a node, counting them from the leaves up.
+        if node.__class__ is Leaf:
+            return len(node.ids)
+        return sum(self._count(child) for child in node.children)
@@ -0,0 +1,392 @@
+import argparse
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import workload
+from library import BACKENDS, Book, GatorLibrary, execute_command, parse_command, run_commands
+from redBlackTree import RedBlackTree
+from sharding import ShardedLibrary
+from wal import WriteAheadLog
+
+
+def time_it(label, func, *args):
+    # Runs func once with the given arguments and prints how long it took.
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<12} {elapsed:10.3f} s")
+    return result
+
+
+def bench_tree(n, seed):
+    """
+    Times the core RedBlackTree operations on n books with random IDs: inserting them all,
+    a range traversal over the whole tree, point lookups, and deleting half of them.
+    """
+    rng = random.Random(seed)
+    book_ids = rng.sample(range(n * 10), n)
+    books = [Book(book_id, "Title", "Author", "Yes") for book_id in book_ids]
+    tree = RedBlackTree()
+
+    def insert_all():
+        for book in books:
+            tree.put(book)
+
+    def lookup_all():
+        for book_id in book_ids:
+            tree.get(book_id)
+
+    def delete_half():
+        for book_id in book_ids[::2]:
+            tree.delete(book_id)
+
+    print(f"tree n={n}")
+    time_it("insert", insert_all)
+    time_it("range", tree.inorder_traversal, 0, n * 10)
+    time_it("lookup", lookup_all)
+    time_it("delete", delete_half)
+
+
+def bench_backends(n, seed, ranges=10000, width=20):
+    """
+    Times each of the BACKENDS as a library's book tree on n books with random IDs: inserting them
+    all, point lookups in the tree and through PrintBook, PrintBooks over ranges that each hold
+    about width books, a scan of the whole tree, and deleting half of the books.
+    """
+    rng = random.Random(seed)
+    book_ids = rng.sample(range(n * 10), n)
+    starts = [rng.randrange(n * 10) for _ in range(ranges)]
+
+    for backend in sorted(BACKENDS):
+        library = GatorLibrary(backend=backend)
+        tree = library.book_tree
+
+        def insert_all():
+            for book_id in book_ids:
+                library.insert_book(book_id, "Title", f"Author {book_id % 1000}", "Yes")
+
+        def lookup_all():
+            for book_id in book_ids:
+                tree.get(book_id)
+
+        def print_each():
+            for book_id in book_ids:
+                library.print_book(book_id, discard)
+
+        def print_ranges():
+            for start in starts:
+                library.print_books(start, start + width * 10, discard)
+
+        def scan():
+            for _ in tree.iter_range(float('-inf'), float('inf')):
+                pass
+
+        def delete_half():
+            for book_id in book_ids[::2]:
+                library.delete_book(book_id, discard)
+
+        print(f"{backend} n={n}")
+        with open(os.devnull, "w") as discard:
+            time_it("insert", insert_all)
+            time_it("lookup", lookup_all)
+            time_it("PrintBook", print_each)
+            time_it("PrintBooks", print_ranges)
+            time_it("scan", scan)
+            time_it("delete", delete_half)
+
+
+def bench_memory(n, seed):
+    """
+    Measures the memory held by a library of n books, excluding the input strings themselves.
+    Authors are drawn from a small pool, as in a real catalog, so interning can share them.
+    """
+    rng = random.Random(seed)
+    authors = [f"Author {i}" for i in range(1000)]
+    # Build fresh string objects for each row, the way the command parser does.
+    rows = [(book_id, f"Title {book_id}", "".join(rng.choice(authors)), "".join("Yes"))
+            for book_id in rng.sample(range(n * 10), n)]
+
+    tracemalloc.start()
+    library = GatorLibrary()
+    for row in rows:
+        library.insert_book(*row)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"memory n={n}")
+    print(f"  {'per book':<12} {current / n:10.1f} bytes")
+
+
+def bench_wal(n, seed, group_sizes=(1, 8, 64, 512)):
+    """
+    Runs n BorrowBook/ReturnBook commands against a library with a write-ahead log, once for each
+    group commit size, and reports the throughput. Checkpoints are disabled so that only logging
+    and syncing are measured.
+    """
+    rng = random.Random(seed)
+    lines = [f'InsertBook({book_id}, "Title", "Author", "Yes")\n' for book_id in range(1000)]
+    for _ in range(n):
+        if rng.random() < 0.6:
+            lines.append(f"BorrowBook({rng.randint(1, 500)}, {rng.randrange(1000)}, {rng.randint(1, 5)})\n")
+        else:
+            lines.append(f"ReturnBook({rng.randint(1, 500)}, {rng.randrange(1000)})\n")
+
+    print(f"wal n={n}")
+    for group_size in group_sizes:
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as discard:
+            library = GatorLibrary()
+            log = WriteAheadLog(library, directory, group_size, checkpoint_every=len(lines) + 1)
+            log.recover()
+            start = time.perf_counter()
+            run_commands(library, lines, discard, log=log)
+            log.close()
+            elapsed = time.perf_counter() - start
+        print(f"  group {group_size:<6} {len(lines) / elapsed:10.0f} commands/s")
+
+
+def bench_shards(n, seed, shard_counts=(1, 2, 4, 8)):
+    """
+    Runs n commands, mostly about single books with 1% PrintBooks ranges, against one library in
+    this process and then against libraries sharded across each number of worker processes, and
+    reports the throughput. Finally times splitting the largest of 4 shards in two.
+    """
+    rng = random.Random(seed)
+    key_space = 100000
+    lines = [f'InsertBook({book_id}, "Title {book_id}", "Author", "Yes")\n' for book_id in range(0, key_space, 2)]
+    for _ in range(n):
+        choice = rng.random()
+        book_id = rng.randrange(key_space)
+        if choice < 0.3:
+            lines.append(f"PrintBook({book_id})\n")
+        elif choice < 0.6:
+            lines.append(f"BorrowBook({rng.randint(1, 1000)}, {book_id}, {rng.randint(1, 5)})\n")
+        elif choice < 0.89:
+            lines.append(f"ReturnBook({rng.randint(1, 1000)}, {book_id})\n")
+        elif choice < 0.99:
+            lines.append(f'InsertBook({book_id}, "Title {book_id}", "Author", "Yes")\n')
+        else:
+            lines.append(f"PrintBooks({book_id}, {book_id + 20})\n")
+
+    print(f"shards n={n} ({os.cpu_count()} cores)")
+    with open(os.devnull, "w") as discard:
+        start = time.perf_counter()
+        run_commands(GatorLibrary(), lines, discard)
+        elapsed = time.perf_counter() - start
+        print(f"  {'in process':<12} {len(lines) / elapsed:10.0f} commands/s")
+        for shard_count in shard_counts:
+            with ShardedLibrary.evenly(shard_count, key_space) as library:
+                start = time.perf_counter()
+                library.run_commands(lines, discard)
+                elapsed = time.perf_counter() - start
+                print(f"  {shard_count:<2} shards    {len(lines) / elapsed:10.0f} commands/s")
+                if shard_count == 4:
+                    time_it("split", library.split_largest)
+
+
+def mixed_load(library, persistent, n, seed, readers, duration):
+    """
+    Runs BorrowBook/ReturnBook writes on this thread for duration seconds while readers threads
+    print ranges of 10% of the catalog. With the in-place tree, readers and the writer share a
+    lock. With the persistent tree, the writer hands each reader a snapshot when it asks for one,
+    between writes, and nothing is locked. Returns the writes, their latencies and the reads.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    requests = queue.SimpleQueue()  # Queues of readers waiting for a snapshot.
+    stop = threading.Event()
+    reads = [0]
+
+    def reader(reader_seed):
+        reader_rng = random.Random(reader_seed)
+        snapshots = queue.SimpleQueue()
+        with open(os.devnull, "w") as discard:
+            while not stop.is_set():
+                start = reader_rng.randrange(n * 9 // 10)
+                if persistent:
+                    requests.put(snapshots)
+                    snapshots.get().print_books(start, start + n // 10, discard)
+                else:
+                    with lock:
+                        library.print_books(start, start + n // 10, discard)
+                reads[0] += 1
+
+    threads = [threading.Thread(target=reader, args=(seed + i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    latencies = []
+    with open(os.devnull, "w") as discard:
+        deadline = time.perf_counter() + duration
+        while True:
+            began = time.perf_counter()
+            if began >= deadline:
+                break
+            patron_id = rng.randint(1, 1000)
+            book_id = rng.randrange(n)
+            if persistent:
+                while not requests.empty():
+                    requests.get().put(library.snapshot())
+                library.borrow_book(patron_id, book_id, 1, discard)
+                library.return_book(patron_id, book_id, discard)
+            else:
+                with lock:
+                    library.borrow_book(patron_id, book_id, 1, discard)
+                    library.return_book(patron_id, book_id, discard)
+            latencies.append(time.perf_counter() - began)
+    stop.set()
+    while any(thread.is_alive() for thread in threads):
+        # Readers may be waiting for one last snapshot.
+        while not requests.empty():
+            requests.get().put(library.snapshot())
+        time.sleep(0.001)
+    return len(latencies) * 2, sorted(latencies), reads[0]
+
+
+def bench_persistent(n, seed, readers=2, duration=2.0):
+    """
+    Compares the in-place and persistent trees on n books: write throughput alone, then write
+    throughput and latency, and read throughput, with readers threads scanning large ranges.
+    """
+    print(f"persistent n={n} readers={readers}")
+    for persistent in (False, True):
+        library = GatorLibrary(persistent)
+        library.bulk_insert_books((book_id, f"Title {book_id}", "Author", "Yes") for book_id in range(n))
+        label = "persistent" if persistent else "in place"
+        writes, _, _ = mixed_load(library, persistent, n, seed, 0, duration)
+        print(f"  {label:<12} writes alone {writes / duration:10.0f} /s")
+        writes, latencies, reads = mixed_load(library, persistent, n, seed, readers, duration)
+        print(f"  {label:<12} with readers {writes / duration:10.0f} writes/s, "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.2f} ms, max {latencies[-1] * 1000:7.2f} ms, "
+              f"{reads / duration:6.1f} range reads/s")
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def peak_memory():
+    # The peak resident set size of this process in MiB, where the platform reports it.
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def bench_workload(n, args):
+    """
+    Loads a catalog of n books, then runs a synthetic workload (see workload.py), timing every
+    command. Reports the throughput, latency percentiles for each kind of command, and the peak
+    memory of the process.
+    """
+    lines = list(workload.command_lines(args.seed, args.commands, n, args.mix, args.zipf, args.patrons))
+    library = GatorLibrary()
+    latencies = {}
+    clock = time.perf_counter_ns
+    print(f"workload catalog={n} commands={len(lines)} "
+          f"{'zipf ' + str(args.zipf) if args.zipf is not None else 'uniform'}")
+    with open(os.devnull, "w") as discard:
+        time_it("load", run_commands, library, workload.catalog_lines(n), discard, "<catalog>", True)
+        start = time.perf_counter()
+        for line in lines:
+            began = clock()
+            command, arguments = parse_command(line)
+            execute_command(library, command, arguments, discard)
+            elapsed = clock() - began
+            timings = latencies.get(command)
+            if timings is None:
+                timings = latencies[command] = []
+            timings.append(elapsed)
+        total = time.perf_counter() - start
+
+    print(f"  {'throughput':<12} {len(lines) / total:10.0f} commands/s")
+    print(f"  {'command':<18} {'count':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'p99.9':>8} {'max':>9}  (us)")
+    for command, timings in sorted(latencies.items()):
+        timings.sort()
+        print(f"  {command:<18} {len(timings):8d}"
+              + "".join(f" {percentile(timings, fraction) / 1000:8.1f}" for fraction in (0.5, 0.9, 0.99, 0.999))
+              + f" {timings[-1] / 1000:9.1f}")
+    peak = peak_memory()
+    if peak is not None:
+        print(f"  {'peak memory':<12} {peak:10.1f} MiB")
+
+
+def check_workload(n, args, revision):
+    """
+    Runs the same workload through library.py as it is now and as it was at a git revision, and
+    checks that the two output files are byte-identical.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        reference = os.path.join(directory, "reference")
+        os.mkdir(reference)
+        archive = subprocess.run(["git", "archive", revision], cwd=here, check=True, capture_output=True).stdout
+        subprocess.run(["tar", "-x", "-C", reference], input=archive, check=True)
+
+        outputs = []
+        for name, script in (("current", os.path.join(here, "library.py")),
+                             (revision, os.path.join(reference, "library.py"))):
+            run_directory = os.path.join(directory, f"run{len(outputs)}")
+            os.mkdir(run_directory)
+            with open(os.path.join(run_directory, "workload.txt"), "w") as file:
+                file.writelines(workload.generate(args.seed, args.commands, n, args.mix, args.zipf, args.patrons))
+            subprocess.run([sys.executable, script, "workload.txt"], cwd=run_directory, check=True)
+            with open(os.path.join(run_directory, "workload_output_file.txt"), "rb") as file:
+                outputs.append(file.read())
+
+    if outputs[0] == outputs[1]:
+        print(f"  output identical to {revision} ({len(outputs[0])} bytes)")
+        return True
+    current, previous = outputs[0].split(b"\n"), outputs[1].split(b"\n")
+    line = next((i for i, pair in enumerate(zip(current, previous), 1) if pair[0] != pair[1]),
+                min(len(current), len(previous)) + 1)
+    print(f"  output differs from {revision} at line {line}")
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the GatorLibrary data structures.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10 ** 5, 10 ** 6],
+                        help="number of books to benchmark with")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--memory", action="store_true", help="measure memory per book instead of timing")
+    parser.add_argument("--wal", action="store_true", help="measure write-ahead log throughput instead")
+    parser.add_argument("--shards", action="store_true", help="measure sharded throughput against one process")
+    parser.add_argument("--backends", action="store_true",
+                        help="compare the book tree backends on point lookups and PrintBooks ranges")
+    parser.add_argument("--persistent", action="store_true",
+                        help="compare the in-place and persistent trees under mixed reads and writes")
+    parser.add_argument("--workload", action="store_true",
+                        help="run a synthetic workload against a catalog of each size, with per-command latencies")
+    parser.add_argument("--check", nargs="?", const="HEAD", metavar="REVISION",
+                        help="with --workload, also check the output is byte-identical to library.py at a git revision")
+    workload.add_arguments(parser)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        if args.memory:
+            bench_memory(n, args.seed)
+        elif args.wal:
+            bench_wal(n, args.seed)
+        elif args.shards:
+            bench_shards(n, args.seed)
+        elif args.backends:
+            bench_backends(n, args.seed)
+        elif args.persistent:
+            bench_persistent(n, args.seed)
+        elif args.workload:
+            bench_workload(n, args)
+            if args.check and not check_workload(n, args, args.check):
+                sys.exit(1)
+        else:
+            bench_tree(n, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+class BookTree:
+    """
+    The methods shared by the trees that can hold a GatorLibrary's books, written in terms of
+    the ones each tree provides itself: put, get, rank, iter_range, bulk_load and __len__. Keys
+    are books, ordered by book_id, and the nodes a tree hands out have the book as their key.
+    """
+    # Whether get_for_update hands out a copy of the book rather than the one stored before.
+    copies_on_update = False
+
+    def _new_tree(self):
+        # returns an empty tree of the same kind and settings, for split().
+        return type(self)()
+
+    def count_range(self, start_key, end_key):
+        # returns the number of keys from start_key to end_key (inclusive).
+        if start_key > end_key:
+            return 0
+        count = self.rank(end_key) - self.rank(start_key)
+        if self.get(end_key):
+            count += 1
+        return count
+
+    def inorder_traversal(self, start_key, end_key):
+        """
+        Returns a list of the nodes in the tree, in order, from start_key to end_key (inclusive).
+        """
+        return list(self.iter_range(start_key, end_key))
+
+    def bulk_insert(self, keys):
+        """
+        Inserts all of the given keys at once by merging them with the keys already in the tree
+        and rebuilding the tree bottom-up, which takes O(n + m) instead of O(m log(n + m)).
+        A batch too small for that to pay off is put() one key at a time instead, and those
+        inserts count color flips as usual in a tree that counts them. As with put(), a key whose
+        book_id is already present leaves the existing key in place.
+        """
+        keys = list(keys)
+        size = len(self)
+        if len(keys) * (size + len(keys)).bit_length() < size:
+            for key in keys:
+                self.put(key)
+            return
+
+        new_keys = []
+        for key in sorted(keys, key=lambda k: k.book_id):
+            # Keep only the first key for each book_id, matching repeated put() calls.
+            if not new_keys or new_keys[-1].book_id != key.book_id:
+                new_keys.append(key)
+
+        old_keys = self._collect_keys()
+        if not old_keys:
+            self.bulk_load(new_keys)
+            return
+
+        # Standard two-way merge of the existing keys and the new batch.
+        merged = []
+        i = j = 0
+        while i < len(old_keys) and j < len(new_keys):
+            if old_keys[i].book_id < new_keys[j].book_id:
+                merged.append(old_keys[i])
+                i += 1
+            elif old_keys[i].book_id > new_keys[j].book_id:
+                merged.append(new_keys[j])
+                j += 1
+            else:
+                merged.append(old_keys[i])
+                i += 1
+                j += 1
+        merged.extend(old_keys[i:])
+        merged.extend(new_keys[j:])
+        self.bulk_load(merged)
+
+    def split(self, key):
+        """
+        Removes every key of at least the given book_id and returns them as a new tree of the
+        same kind, leaving the smaller keys in this one. Both trees are rebuilt bottom-up, which
+        takes O(n).
+        """
+        keys = self._collect_keys()
+        # Binary search for the first key that belongs in the new tree.
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if keys[middle].book_id < key:
+                low = middle + 1
+            else:
+                high = middle
+        other = self._new_tree()
+        other.bulk_load(keys[low:])
+        self.bulk_load(keys[:low])
+        return other
+
+    def _collect_keys(self):
+        # returns every key in the tree in order of book_id.
+        return [node.key for node in self.iter_range(float('-inf'), float('inf'))]
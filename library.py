@@ -1,251 +1,846 @@
+import argparse
+import bisect
+import contextlib
+import re
 import sys
-import time
 from redBlackTree import RedBlackTree
+from persistentTree import PersistentRedBlackTree
+from bPlusTree import BPlusTree
 from minHeap import MinHeap
+from sortedIndex import SortedIndex
 
 # Book class represents a single book in the library.
 class Book:
+    # Slots keep each book small, since a large catalog holds millions of them.
+    __slots__ = ("book_id", "book_name", "author_name", "availability_status", "borrowed_by", "_reservation_heap")
+
     def __init__(self, book_id, book_name, author_name, availability_status):
         # Initialize the Book object with its properties.
         self.book_id = book_id
         self.book_name = book_name
-        self.author_name = author_name
-        self.availability_status = availability_status
+        # Authors and statuses repeat across many books, so share one copy of each string.
+        self.author_name = sys.intern(author_name)
+        self.availability_status = sys.intern(availability_status)
         self.borrowed_by = None  # Initially, no one has borrowed the book.
-        self.reservation_heap = MinHeap()  # Use a MinHeap to manage reservations.
+        self._reservation_heap = None  # The MinHeap is only created once someone reserves the book.
+
+    @property
+    def reservation_heap(self):
+        # Use a MinHeap to manage reservations, creating it on first use.
+        if self._reservation_heap is None:
+            self._reservation_heap = MinHeap()
+        return self._reservation_heap
+
+    def has_reservations(self):
+        # Returns True if any patron is waiting for this book.
+        return self._reservation_heap is not None and not self._reservation_heap.is_empty()
+
+    def reservations(self):
+        # Returns the reservation entries in heap order, skipping the dummy element at index 0.
+        if self._reservation_heap is None:
+            return []
+        return self._reservation_heap.heap[1:]
+
+    def reserved_patrons(self):
+        # Returns the IDs of the patrons waiting for this book, in the order they will be served.
+        return [reservation[0] for reservation in sorted(self.reservations(), key=lambda r: (r[1], r[2]))]
+
+    def copy(self):
+        # Returns a copy of the book with its own reservation heap, skipping the string interning in __init__.
+        other = Book.__new__(Book)
+        other.book_id = self.book_id
+        other.book_name = self.book_name
+        other.author_name = self.author_name
+        other.availability_status = self.availability_status
+        other.borrowed_by = self.borrowed_by
+        other._reservation_heap = self._reservation_heap.copy() if self._reservation_heap is not None else None
+        return other
+
+    def render(self):
+        # Formats the book as the record written by PrintBook, PrintBooks and FindClosestBook.
+        return (f"\nBookID = {self.book_id}\n"
+                f"Title = \"{self.book_name}\"\n"
+                f"Author = \"{self.author_name}\"\n"
+                f"Availability = \"{self.availability_status}\"\n"
+                f"BorrowedBy = {self.borrowed_by if self.borrowed_by is not None else 'None'}\n"
+                f"Reservations = {self.reserved_patrons()}\n")
 
     def __str__(self):
         # String representation of the Book object for easy printing.
         return f"ID: {self.book_id}, Title: {self.book_name}, Author: {self.author_name}, Status: {'Available' if self.availability_status else 'Borrowed'}, Borrowed By: {self.borrowed_by if self.borrowed_by else 'None'}"
 
 
+# Patron class records which books a patron has borrowed and which they are waiting for.
+class Patron:
+    __slots__ = ("borrowed", "reserved")
+
+    def __init__(self):
+        self.borrowed = set()  # IDs of books the patron currently holds.
+        self.reserved = set()  # IDs of books the patron has reserved.
+
+
+# The trees that can hold a library's books. Each offers put, get, get_for_update, delete, floor,
+# ceiling, iter_range, rank, select, count_range, bulk_insert, bulk_load, split and height, and
+# lookups return an object whose key is the book. Only the red-black tree counts color flips.
+BACKENDS = {
+    "rbtree": RedBlackTree,
+    "bplustree": BPlusTree,
+}
+
+
 # GatorLibrary class manages the collection of books and their operations.
 class GatorLibrary:
-    def __init__(self):
-        # Initialize a Red-Black Tree to store and manage books efficiently.
-        self.book_tree = RedBlackTree()
+    def __init__(self, persistent=False, backend="rbtree"):
+        # Initialize a Red-Black Tree, or another of the BACKENDS, to store and manage books efficiently.
+        # A persistent tree keeps every version intact, so that snapshots can be read while it changes.
+        if persistent:
+            if backend != "rbtree":
+                raise ValueError("only the rbtree backend can be persistent")
+            self.book_tree = PersistentRedBlackTree()
+        else:
+            self.book_tree = BACKENDS[backend]()
+        # Index from patron ID to Patron, kept up to date by every command that lends,
+        # reserves, returns or deletes books. Patrons with nothing borrowed or reserved are dropped.
+        self.patrons = {}
+        # Secondary indexes kept up to date by every command that adds or removes books: from each
+        # author to a list of (book ID, book) sorted by ID, and from (title, book ID) in sorted
+        # order to the book. They hold the books themselves, so a query needs no tree lookups.
+        self.author_index = {}
+        self.title_index = SortedIndex()
+        # Collects command latencies and tree and heap counters when instrumentation is enabled.
+        self.metrics = None
+
+    def snapshot(self):
+        """
+        Returns a read-only GatorLibrary holding the books as they are now, for a persistent
+        library only. It can run the commands in SNAPSHOT_COMMANDS on any thread without locking,
+        however the library changes in the meantime.
+        """
+        view = GatorLibrary()
+        view.book_tree = self.book_tree.snapshot()
+        return view
+
+    def _patron(self, patron_id):
+        # Returns the index entry for a patron, creating it if needed.
+        patron = self.patrons.get(patron_id)
+        if patron is None:
+            patron = self.patrons[patron_id] = Patron()
+        return patron
+
+    def _release(self, patron_id, book_id, borrowed):
+        # Removes a book from a patron's borrowed or reserved set, dropping the patron once idle.
+        patron = self.patrons.get(patron_id)
+        if patron is None:
+            return
+        (patron.borrowed if borrowed else patron.reserved).discard(book_id)
+        if not patron.borrowed and not patron.reserved:
+            del self.patrons[patron_id]
 
     def insert_book(self, book_id, book_name, author_name, availability_status):
         # Add a new book to the library.
         book = Book(book_id, book_name, author_name, availability_status)
+        size = len(self.book_tree)
         self.book_tree.put(book)
+        # A book whose ID is already taken is not added, so only index the book if the tree grew.
+        if len(self.book_tree) > size:
+            self._index_book(book)
+
+    def bulk_insert_books(self, books):
+        """
+        Adds many books at once. Each item is a (book_id, book_name, author_name, availability_status)
+        tuple, as accepted by insert_book. The batch is sorted and the tree rebuilt bottom-up in
+        linear time, merging with any books already in the library. Books inserted this way do
+        not add to the color flip count, since the tree is built without any flips. A batch that
+        is small next to the library is inserted one book at a time instead, which is cheaper
+        than rebuilding, and does count flips.
+        """
+        books = [Book(*book) for book in books]
+        self.book_tree.bulk_insert(books)
+        # Index only the books that made it into the tree, rather than duplicates of existing IDs.
+        added = [book for book in books if self.book_tree.get(book.book_id).key is book]
+        new_entries = {}
+        for book in added:
+            new_entries.setdefault(book.author_name, []).append((book.book_id, book))
+        for author_name, entries in new_entries.items():
+            # Both runs are sorted, so sorting them together is a linear merge.
+            author_entries = self.author_index.setdefault(author_name, [])
+            author_entries.extend(sorted(entries))
+            author_entries.sort()
+        self.title_index.add_many((book.book_name, book.book_id, book) for book in added)
+
+    def rebuild_indexes(self):
+        # Rebuilds the author and title indexes from the books in the tree.
+        self.author_index = {}
+        self.title_index.clear()
+        books = [node.key for node in self.book_tree.iter_range(float('-inf'), float('inf'))]
+        for book in books:
+            # Books come in ID order, so each author's list stays sorted.
+            self.author_index.setdefault(book.author_name, []).append((book.book_id, book))
+        self.title_index.add_many((book.book_name, book.book_id, book) for book in books)
+
+    def _index_book(self, book):
+        entries = self.author_index.get(book.author_name)
+        if entries is None:
+            entries = self.author_index[book.author_name] = []
+        bisect.insort(entries, (book.book_id, book))
+        self.title_index.add(book.book_name, book.book_id, book)
+
+    def _unindex_book(self, book):
+        entries = self.author_index[book.author_name]
+        del entries[bisect.bisect_left(entries, (book.book_id,))]
+        if not entries:
+            del self.author_index[book.author_name]
+        self.title_index.remove(book.book_name, book.book_id)
+
+    def _get_for_update(self, book_id):
+        """
+        Returns the tree node for a book that the caller is about to change, or None. A persistent
+        tree hands out a copy of the book, which then takes the old one's place in the indexes.
+        """
+        node = self.book_tree.get_for_update(book_id)
+        if node and self.book_tree.copies_on_update:
+            book = node.key
+            entries = self.author_index[book.author_name]
+            entries[bisect.bisect_left(entries, (book_id,))] = (book_id, book)
+            self.title_index.replace(book.book_name, book_id, book)
+        return node
 
     def print_book(self, book_id, output_file):
         # Print the details of a book based on its ID to an output file.
         book = self.book_tree.get(book_id)
         if book:
             # If the book is found, write its details to the file.
-            output_file.writelines(f"\nBookID = {book.key.book_id}")
-            output_file.writelines(f"Title = \"{book.key.book_name}\"")
-            output_file.writelines(f"Author = \"{book.key.author_name}\"")
-            output_file.writelines(f"Availability = \"{'Yes' if book.key.availability_status else 'No'}\"")
-            output_file.writelines(f"BorrowedBy = {book.key.borrowed_by if book.key.borrowed_by else 'None'}")
-            # Extract reservation list from the heap and write it.
-            reservations = [reservation[0] for reservation in
-                            book.key.reservation_heap.heap[1:][::-1]]  # Skip the first None element in the heap.
-            output_file.writelines(f"Reservations = {reservations}\n")
+            output_file.write(book.key.render())
         else:
             # If the book is not found, indicate this in the file.
-            output_file.writelines(f"Book {book_id} not found in the Library")
+            output_file.write(f"Book {book_id} not found in the Library")
 
     def print_books(self, book_id1, book_id2, output_file):
         # Print details of all books within a given range of book IDs.
-        books = self.book_tree.inorder_traversal(book_id1, book_id2)
-        if not books:
+        # Books are streamed from the tree one at a time, so memory use does not grow with the range.
+        found = False
+        for book in self.book_tree.iter_range(book_id1, book_id2):
+            output_file.write(book.key.render())
+            found = True
+        if not found:
             # If no books are found within the range, write a message to the file.
-            output_file.writelines(f"No books found in the range [{book_id1}, {book_id2}]")
+            output_file.write(f"No books found in the range [{book_id1}, {book_id2}]")
+
+    def print_books_page(self, book_id1, book_id2, offset, limit, output_file):
+        # Print up to limit books from a range of book IDs, skipping the first offset books in the range.
+        # The first book of the page is found by rank, so the skipped books are never visited.
+        start = self.book_tree.select(self.book_tree.rank(book_id1) + max(offset, 0))
+        found = False
+        if start and limit > 0:
+            for book in self.book_tree.iter_range(start.key.book_id, book_id2, limit=limit):
+                output_file.write(book.key.render())
+                found = True
+        if not found:
+            output_file.write(f"No books found in the range [{book_id1}, {book_id2}]")
+
+    def count_books(self, book_id1, book_id2, output_file):
+        # Count the books within a given range of book IDs.
+        count = self.book_tree.count_range(book_id1, book_id2)
+        output_file.write(f"\nBooks in the range [{book_id1}, {book_id2}]: {count}\n")
+
+    def rank_of(self, book_id, output_file):
+        # Print the position of a book in order of book ID, counting from 1.
+        if self.book_tree.get(book_id):
+            output_file.write(f"\nBook {book_id} has rank {self.book_tree.rank(book_id) + 1}\n")
         else:
-            # If books are found, iterate through them and write their details.
-            for book in books:
-                output_file.writelines(f"\nBookID = {book.key.book_id}")
-                output_file.writelines(f"Title = \"{book.key.book_name}\"")
-                output_file.writelines(f"Author = \"{book.key.author_name}\"")
-                output_file.writelines(f"Availability = \"{book.key.availability_status}\"")
-                output_file.writelines(f"BorrowedBy = \"{book.key.borrowed_by}\"")
-                reservations = [reservation[0] for reservation in
-                                book.key.reservation_heap.heap[1:]]  # Skip the first None element in the heap.
-                output_file.writelines(f"Reservations = {reservations}\n")
+            output_file.write(f"Book {book_id} not found in the Library")
+
+    def select_book(self, rank, output_file):
+        # Print the book at the given position in order of book ID, counting from 1.
+        book = self.book_tree.select(rank - 1)
+        if book:
+            output_file.write(book.key.render())
+        else:
+            output_file.write(f"No book with rank {rank} in the Library")
 
     def borrow_book(self, patron_id, book_id, patron_priority, output_file):
         # Borrow a book from the library by a patron.
-        book = self.book_tree.get(book_id)
-        if book and book.key.availability_status == "Yes":
+        book = self._get_for_update(book_id)
+        if not book:
+            output_file.write(f"Book {book_id} not found in the Library")
+        elif book.key.availability_status == "Yes":
             # If the book is available, mark it as borrowed.
             book.key.availability_status = "No"
             book.key.borrowed_by = patron_id
-            output_file.writelines(f"\nBook {book_id} borrowed by Patron {patron_id}\n")
-        else:
+            self._patron(patron_id).borrowed.add(book_id)
+            output_file.write(f"\nBook {book_id} borrowed by Patron {patron_id}\n")
+        elif book.key.reservation_heap.reserve(patron_id, patron_priority):
             # If the book is not available, add a reservation to the book's MinHeap.
-            reservation_data = (patron_id, patron_priority, time.time())  # Timestamp for reservation order.
-            book.key.reservation_heap.insert(reservation_data)
-            output_file.writelines(f"\nBook {book_id} Reserved for Patron {patron_id}\n")
+            self._patron(patron_id).reserved.add(book_id)
+            output_file.write(f"\nBook {book_id} Reserved for Patron {patron_id}\n")
+        else:
+            output_file.write(f"\nPatron {patron_id} already has a reservation for Book {book_id}\n")
+
+    def cancel_reservation(self, patron_id, book_id, output_file):
+        # Remove a patron's reservation for a book.
+        book = self._get_for_update(book_id)
+        if book and book.key.has_reservations() and book.key.reservation_heap.cancel(patron_id):
+            self._release(patron_id, book_id, borrowed=False)
+            output_file.write(f"\nReservation of Book {book_id} by Patron {patron_id} cancelled\n")
+        elif book:
+            output_file.write(f"\nPatron {patron_id} has no reservation for Book {book_id}\n")
+        else:
+            output_file.write(f"Book {book_id} not found in the Library")
+
+    def update_priority(self, patron_id, book_id, patron_priority, output_file):
+        # Change the priority of a patron's reservation for a book.
+        book = self._get_for_update(book_id)
+        if book and book.key.has_reservations() and book.key.reservation_heap.update_priority(patron_id, patron_priority):
+            output_file.write(f"\nPriority of Patron {patron_id} for Book {book_id} updated to {patron_priority}\n")
+        elif book:
+            output_file.write(f"\nPatron {patron_id} has no reservation for Book {book_id}\n")
+        else:
+            output_file.write(f"Book {book_id} not found in the Library")
 
     def return_book(self, patron_id, book_id, output_file):
         # Return a book to the library by a patron.
-        book = self.book_tree.get(book_id)
+        book = self._get_for_update(book_id)
         if book and book.key.availability_status == "No" and book.key.borrowed_by == patron_id:
             # If the book is borrowed by the same patron, process the return.
             book.key.availability_status = "Yes"
-            book.borrowed_by = None
+            book.key.borrowed_by = None
+            self._release(patron_id, book_id, borrowed=True)
             # Process any reservations for the book.
-            if not book.key.reservation_heap.is_empty():
+            if book.key.has_reservations():
                 # Allocate the book to the next patron in the reservation list.
                 reservation_data = book.key.reservation_heap.extract_min()
                 reserved_patron_id, _, _ = reservation_data
                 book.key.availability_status = "No"
                 book.key.borrowed_by = reserved_patron_id
-                output_file.writelines(
+                self._release(reserved_patron_id, book_id, borrowed=False)
+                self._patron(reserved_patron_id).borrowed.add(book_id)
+                output_file.write(
                     f"Book {book_id}  Returned by Patron {patron_id}.\nBook {book_id} Allotted to Patron {reserved_patron_id}")
             else:
-                output_file.writelines(f"Book {book_id}  Returned by Patron {patron_id}")
+                output_file.write(f"Book {book_id}  Returned by Patron {patron_id}")
         else:
             # If conditions for return are not met, write an error message.
-            output_file.writelines(f"Patron {patron_id} cannot return Book {book_id}")
+            output_file.write(f"Patron {patron_id} cannot return Book {book_id}")
 
     def delete_book(self, book_id, output_file):
         # Delete a book from the library.
-        book = self.book_tree.get(book_id)
+        book = self._get_for_update(book_id)
         if book:
             # Notify patrons who have reserved this book.
             reservations = []
-            while not book.key.reservation_heap.is_empty():
+            while book.key.has_reservations():
                 reservation_data = book.key.reservation_heap.extract_min()
                 reserved_patron_id, _, _ = reservation_data
                 reservations.append(reserved_patron_id)
+                self._release(reserved_patron_id, book_id, borrowed=False)
+            if book.key.borrowed_by is not None:
+                self._release(book.key.borrowed_by, book_id, borrowed=True)
+            self._unindex_book(book.key)
 
             # Perform the deletion of the book from the tree.
             self.book_tree.delete(book_id)
 
             # Write notification messages to the output file.
             if reservations:
-                output_file.writelines(f"\nBook {book_id} is no longer available. Reservations made by Patrons {', '.join(map(str, reservations))} have been cancelled.\n")
+                output_file.write(f"\nBook {book_id} is no longer available. Reservations made by Patrons {', '.join(map(str, reservations))} have been cancelled.\n")
             else:
-                output_file.writelines(f"\nBook {book_id} is no longer available.\n")
+                output_file.write(f"\nBook {book_id} is no longer available.\n")
         else:
             # If the book is not found in the library, notify accordingly.
-            output_file.writelines(f"\nBook {book_id} is no longer available\n")
+            output_file.write(f"\nBook {book_id} is no longer available\n")
+
+    def print_patron(self, patron_id, output_file):
+        # Print the books a patron has borrowed and the books they are waiting for.
+        patron = self.patrons.get(patron_id)
+        borrowed = sorted(patron.borrowed) if patron else []
+        reserved = sorted(patron.reserved) if patron else []
+        output_file.write(f"\nPatronID = {patron_id}\nBorrowed = {borrowed}\nReservations = {reserved}\n")
+
+    def cancel_all_reservations(self, patron_id, output_file):
+        # Cancel every reservation a patron holds, for example when their account is closed.
+        patron = self.patrons.get(patron_id)
+        book_ids = sorted(patron.reserved) if patron else []
+        for book_id in book_ids:
+            self._get_for_update(book_id).key.reservation_heap.cancel(patron_id)
+            self._release(patron_id, book_id, borrowed=False)
+        if book_ids:
+            output_file.write(f"\nReservations made by Patron {patron_id} for Books {', '.join(map(str, book_ids))} have been cancelled.\n")
+        else:
+            output_file.write(f"\nPatron {patron_id} has no reservations.\n")
+
+    def find_by_author(self, author_name, output_file):
+        # Print every book by the given author, in order of book ID.
+        # The author's books are found in O(1), so this takes O(1 + k) for k books.
+        found = False
+        for _, book in self.author_index.get(author_name, ()):
+            output_file.write(book.render())
+            found = True
+        if not found:
+            output_file.write(f"No books found by author \"{author_name}\"")
+
+    def find_by_title_prefix(self, prefix, output_file):
+        # Print every book whose title starts with prefix, in order of title and then book ID.
+        # The matching books are found by binary search, so this takes O(log n + k) for k books.
+        found = False
+        for _, _, book in self.title_index.iter_prefix(prefix):
+            output_file.write(book.render())
+            found = True
+        if not found:
+            output_file.write(f"No books found with title starting with \"{prefix}\"")
+
+    def closest_books(self, target_id):
+        # Returns the book closest to target_id, or both books if two are equally close, in ID order.
+        lower = self.book_tree.floor(target_id)
+        upper = self.book_tree.ceiling(target_id)
+        if lower is upper or not upper:
+            closest_books = [lower] if lower else []
+        elif not lower or upper.key.book_id - target_id < target_id - lower.key.book_id:
+            closest_books = [upper]
+        elif upper.key.book_id - target_id > target_id - lower.key.book_id:
+            closest_books = [lower]
+        else:
+            closest_books = [lower, upper]
+        return [book.key for book in closest_books]
 
     def find_closest_book(self, target_id, output_file):
-        # Find the book(s) closest to a given ID.
-        closest_books = []
-        closest_distance = float('inf')
-
-        def search_closest(node):
-            nonlocal closest_books, closest_distance
-            # Recursive function to traverse the tree and find the closest book.
-            if not node:
-                return
-
-            # Calculate the distance of the current book from the target ID.
-            distance = abs(target_id - node.key.book_id)
-
-            # Update the list of closest books based on the distance.
-            if distance < closest_distance:
-                closest_books = [node]
-                closest_distance = distance
-            elif distance == closest_distance:
-                closest_books.append(node)
-
-            # Traverse the tree based on how the current ID compares to the target.
-            if target_id < node.key.book_id:
-                search_closest(node.left)
-            elif target_id > node.key.book_id:
-                search_closest(node.right)
-
-        # Start the search from the root of the tree.
-        search_closest(self.book_tree.root)
-        # Additional code to handle output_file and writing the results would be here.
-
+        # Find the book(s) closest to a given ID; if two books are equally close, print both.
+        closest_books = self.closest_books(target_id)
         if closest_books:
-            for book in closest_books[::-1]:
-                output_file.writelines(f"\nBookID = {book.key.book_id}")
-                output_file.writelines(f"Title = \"{book.key.book_name}\"")
-                output_file.writelines(f"Author = \"{book.key.author_name}\"")
-                output_file.writelines(f"Availability = \"{book.key.availability_status}\"")
-                output_file.writelines(f"BorrowedBy = \"{book.key.borrowed_by}\"")
-                reservations = [reservation[0] for reservation in
-                                book.key.reservation_heap.heap[1:]]  # Skip the first None element
-                output_file.writelines(f"Reservations = {reservations}\n")
+            for book in closest_books:
+                output_file.write(book.render())
         else:
-            output_file.writelines(f"No books found in the library.")
+            output_file.write(f"No books found in the library.")
+
+    def nearest_books(self, target_id, k):
+        """
+        Returns the k books whose IDs are closest to target_id, in order of book ID. When two books
+        are equally close, the one with the lower ID is chosen first. Two cursors walk outward from
+        the target, one downwards and one upwards, so this takes O(log n + k).
+        """
+        below = self.book_tree.iter_range(float('-inf'), target_id, reverse=True)
+        above = self.book_tree.iter_range(target_id + 1, float('inf'))
+        lower = next(below, None)
+        upper = next(above, None)
+        lower_books = []
+        upper_books = []
+        while len(lower_books) + len(upper_books) < k and (lower or upper):
+            if not upper or (lower and target_id - lower.key.book_id <= upper.key.book_id - target_id):
+                lower_books.append(lower.key)
+                lower = next(below, None)
+            else:
+                upper_books.append(upper.key)
+                upper = next(above, None)
+        return lower_books[::-1] + upper_books
+
+    def find_closest_books(self, target_id, k, output_file):
+        # Print the k books whose IDs are closest to target_id, in order of book ID.
+        for book in self.nearest_books(target_id, k):
+            output_file.write(book.render())
+        if not len(self.book_tree):
+            output_file.write(f"No books found in the library.")
+
+    def split_off(self, book_id):
+        """
+        Moves every book with an ID of at least book_id, along with its reservations and patron
+        index entries, into a new GatorLibrary and returns it. Takes time linear in the number
+        of books. The color flip count stays with this library.
+        """
+        other = GatorLibrary()
+        other.book_tree = self.book_tree.split(book_id)
+        self.rebuild_indexes()
+        other.rebuild_indexes()
+        for node in other.book_tree.iter_range(book_id, float('inf')):
+            book = node.key
+            if book.borrowed_by is not None:
+                self._release(book.borrowed_by, book.book_id, borrowed=True)
+                other._patron(book.borrowed_by).borrowed.add(book.book_id)
+            for reservation in book.reservations():
+                self._release(reservation[0], book.book_id, borrowed=False)
+                other._patron(reservation[0]).reserved.add(book.book_id)
+        return other
 
     def color_flip_count(self, output_file):
         flips = self.book_tree.get_color_flips()
-        output_file.writelines(f"\nColor Flip Count: {flips}\n")
+        if flips is None:
+            # Color flips only happen in the red-black tree backend.
+            output_file.write("\nColor Flip Count is only available with the rbtree backend\n")
+            return
+        output_file.write(f"\nColor Flip Count: {flips}\n")
+
+    def health(self):
+        # Returns the size and shape of the book tree and the lengths of the reservation queues.
+        # Walks every book, so it takes O(n).
+        queues = 0
+        reservations = 0
+        longest_queue = 0
+        for node in self.book_tree.iter_range(float('-inf'), float('inf')):
+            length = len(node.key.reservations())
+            if length:
+                queues += 1
+                reservations += length
+                longest_queue = max(longest_queue, length)
+        return {
+            "books": len(self.book_tree),
+            "tree_height": self.book_tree.height(),
+            "color_flips": self.book_tree.get_color_flips(),
+            "reservation_queues": queues,
+            "reservations": reservations,
+            "longest_queue": longest_queue,
+            "patrons": len(self.patrons),
+        }
+
+    def stats(self, output_file):
+        # Print the health of the tree and heaps, and the collected metrics if instrumentation is on.
+        health = self.health()
+        output_file.write(f"\nBooks = {health['books']}\nTree height = {health['tree_height']}\n"
+                          f"Color flips = {health['color_flips']}\n"
+                          f"Reservation queues = {health['reservation_queues']} "
+                          f"(reservations {health['reservations']}, longest {health['longest_queue']})\n"
+                          f"Patrons = {health['patrons']}\n")
+        if self.metrics:
+            self.metrics.report(output_file)
 
     def quit(self, output_file):
         # You can perform cleanup operations here if needed
-        output_file.writelines("Program Terminated.")
-
+        output_file.write("Program Terminated.")
+
+
+
+# A double-quoted string argument; it may contain commas, parentheses and backslash-escaped quotes.
+QUOTED = r'"((?:[^"\\]|\\.)*)"'
+# The arguments of InsertBook: an ID, a quoted title and author, and a status that may be unquoted.
+INSERT_ARGUMENTS = re.compile(r'\s*([-+]?\d+)\s*,\s*' + QUOTED + r'\s*,\s*' + QUOTED + r'\s*,\s*(?:"(\w*)"|(\w+))\s*$')
+ESCAPE_PATTERN = re.compile(r'\\(.)')
+QUOTED_ARGUMENT = re.compile(r'\s*' + QUOTED + r'\s*$')
+
+
+# Commands that only read the book tree, and so can run on a snapshot of a persistent library.
+SNAPSHOT_COMMANDS = {"PrintBook", "PrintBooks", "PrintBooksPage", "CountBooks", "RankOf", "SelectBook",
+                     "FindClosestBook", "FindClosestBooks"}
+
+# Commands that change the library, and so must be written to the write-ahead log.
+MUTATING_COMMANDS = {"InsertBook", "BorrowBook", "ReturnBook", "DeleteBook", "CancelReservation",
+                     "UpdatePriority", "CancelAllReservations"}
+
+
+class CommandError(ValueError):
+    # Raised when an input line is not a well-formed command.
+    pass
+
+
+def parse_integers(text):
+    # Parses a comma-separated list of integers; int() itself skips the surrounding whitespace.
+    if not text.strip():
+        return []
+    return list(map(int, text.split(',')))
+
+
+def parse_insert_arguments(text):
+    # Parses the arguments of InsertBook, unquoting the title and author.
+    match = INSERT_ARGUMENTS.match(text)
+    if not match:
+        raise ValueError(text)
+    book_id, title, author, quoted_status, bare_status = match.groups()
+    if '\\' in title:
+        title = ESCAPE_PATTERN.sub(r'\1', title)
+    if '\\' in author:
+        author = ESCAPE_PATTERN.sub(r'\1', author)
+    return [int(book_id), title, author, quoted_status if quoted_status is not None else bare_status]
+
+
+def parse_quoted(text):
+    # Parses a single double-quoted string argument.
+    match = QUOTED_ARGUMENT.match(text)
+    if not match:
+        raise ValueError(text)
+    value = match.group(1)
+    return [ESCAPE_PATTERN.sub(r'\1', value) if '\\' in value else value]
+
+
+# Maps each command name to the GatorLibrary method that runs it, the parser for its arguments,
+# how many arguments it takes, and whether the method writes to the output file.
+COMMANDS = {
+    "InsertBook": ("insert_book", parse_insert_arguments, 4, False),
+    "PrintBook": ("print_book", parse_integers, 1, True),
+    "PrintBooks": ("print_books", parse_integers, 2, True),
+    "PrintBooksPage": ("print_books_page", parse_integers, 4, True),
+    "CountBooks": ("count_books", parse_integers, 2, True),
+    "RankOf": ("rank_of", parse_integers, 1, True),
+    "SelectBook": ("select_book", parse_integers, 1, True),
+    "BorrowBook": ("borrow_book", parse_integers, 3, True),
+    "ReturnBook": ("return_book", parse_integers, 2, True),
+    "CancelReservation": ("cancel_reservation", parse_integers, 2, True),
+    "UpdatePriority": ("update_priority", parse_integers, 3, True),
+    "DeleteBook": ("delete_book", parse_integers, 1, True),
+    "PrintPatron": ("print_patron", parse_integers, 1, True),
+    "CancelAllReservations": ("cancel_all_reservations", parse_integers, 1, True),
+    "FindByAuthor": ("find_by_author", parse_quoted, 1, True),
+    "FindByTitlePrefix": ("find_by_title_prefix", parse_quoted, 1, True),
+    "FindClosestBook": ("find_closest_book", parse_integers, 1, True),
+    "FindClosestBooks": ("find_closest_books", parse_integers, 2, True),
+    "ColorFlipCount": ("color_flip_count", parse_integers, 0, True),
+    "Stats": ("stats", parse_integers, 0, True),
+    "Quit": ("quit", parse_integers, 0, True),
+}
+
+
+def parse_command(line):
+    """
+    Parses one input line such as 'BorrowBook(120, 48, 2)' into a (command, arguments) pair, with the
+    arguments already converted to the types the command expects. A trailing ';' is allowed, and a
+    command without arguments may be given by its bare name, such as 'Quit'. Blank lines give None.
+    Raises CommandError if the line is malformed.
+    """
+    name, paren, rest = line.partition('(')
+    command = COMMANDS.get(name)
+    if command is None:
+        name = name.strip()
+        if not paren and not name:
+            return None
+        command = COMMANDS.get(name)
+        if command is None:
+            raise CommandError(f"unknown command '{name}'" if paren else f"not a command: '{line.strip()}'")
+
+    _, parse_arguments, arity, _ = command
+    if not paren:
+        if arity == 0:
+            return name, []
+        raise CommandError(f"{name} expects {arity} arguments in parentheses")
+    text, paren, tail = rest.rpartition(')')
+    if not paren:
+        raise CommandError(f"missing closing parenthesis in '{line.strip()}'")
+    if tail.strip() not in ('', ';'):
+        raise CommandError(f"unexpected text after ')' in '{line.strip()}'")
+    try:
+        arguments = parse_arguments(text)
+    except ValueError:
+        raise CommandError(f"invalid arguments for {name}: '{text.strip()}'") from None
+    if len(arguments) != arity:
+        raise CommandError(f"{name} expects {arity} arguments, got {len(arguments)}")
+    return name, arguments
+
+
+def execute_command(library, command, arguments, output_file):
+    # Runs one parsed command against the library, writing any result to output_file.
+    method_name, _, _, writes_output = COMMANDS[command]
+    if writes_output:
+        arguments.append(output_file)
+    getattr(library, method_name)(*arguments)
+
+
+def run_commands(library, lines, output_file, source="<input>", bulk=False, log=None):
+    """
+    Parses and executes commands from an iterable of lines, writing results to output_file.
+    Malformed lines are reported on stderr and skipped. Returns True if a Quit command was seen.
+    In bulk mode, runs of consecutive InsertBook commands are loaded in a single batch.
+    If a write-ahead log is given, each command that changes the library is logged before it runs.
+    If the library has metrics enabled, the time spent parsing and running each command is recorded.
+    A bulk loaded run of InsertBook commands is recorded as one InsertBook, from reading its first
+    line to the end of the batch.
+    """
+    pending_books = []
+    batch_started = None
+    metrics = library.metrics
+    if metrics:
+        output_file = metrics.wrap(output_file)
+
+    def flush_books():
+        # Loads the pending books, returning how long that took if metrics are enabled.
+        if not metrics:
+            library.bulk_insert_books(pending_books)
+            pending_books.clear()
+            return 0
+        loaded = metrics.clock()
+        library.bulk_insert_books(pending_books)
+        pending_books.clear()
+        metrics.record("InsertBook", batch_started, loaded)
+        return metrics.clock() - loaded
+
+    for line_number, line in enumerate(lines, 1):
+        started = metrics.clock() if metrics else None
+        try:
+            parsed = parse_command(line)
+        except CommandError as error:
+            print(f"{source}:{line_number}: {error}", file=sys.stderr)
+            continue
+        if parsed is None:
+            continue
+        command, arguments = parsed
+        if log and command in MUTATING_COMMANDS:
+            log.append(line)
+
+        if bulk and command == "InsertBook":
+            if not pending_books:
+                batch_started = started
+            pending_books.append(arguments)
+            continue
+        if pending_books:
+            # The batch is loaded, and recorded, outside this command's own time.
+            elapsed = flush_books()
+            if metrics:
+                started += elapsed
+
+        ready = metrics.clock() if metrics else None
+        execute_command(library, command, arguments, output_file)
+        if metrics:
+            metrics.record(command, started, ready)
+        if command == "Quit":
+            return True
+        if log:
+            log.maybe_checkpoint()
+
+    if pending_books:
+        flush_books()
+    return False
+
+
+class OutputWriter:
+    """
+    Collects output text in memory and writes it to the underlying file in large chunks once
+    flush_threshold characters have built up. Use it as a context manager so that everything
+    is flushed, and the file closed, however the command stream ends.
+    """
+
+    def __init__(self, file, flush_threshold=1 << 16, close_file=True):
+        self.file = file
+        self.flush_threshold = flush_threshold
+        self.close_file = close_file
+        self._buffer = []
+        self._size = 0
+
+    def write(self, text):
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.flush_threshold:
+            self.flush()
+
+    def flush(self):
+        # Writes everything buffered so far to the file in a single call.
+        if self._buffer:
+            self.file.write(''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.close_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_sharded(args):
+    # Runs the input file, or standard input, against a library sharded across worker processes.
+    from sharding import ShardedLibrary
+    with ShardedLibrary.evenly(args.shards, args.key_space, args.bulk, args.backend) as library:
+        if args.input_file == "-":
+            with OutputWriter(sys.stdout, args.flush_bytes, close_file=False) as output_file:
+                library.run_commands(sys.stdin, output_file, "<stdin>")
+        else:
+            input_file = args.input_file
+            result_name = input_file.split('.')[0] + "_output_file.txt"
+            with open(input_file, 'r') as file, OutputWriter(open(result_name, "a"), args.flush_bytes) as output_file:
+                library.run_commands(file, output_file, input_file)
 
 
 def main():
-    library = GatorLibrary()
-
-    if len(sys.argv) != 2:
-        print("Usage: python library_system.py input_file.txt")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    result_name = input_file.split('.')[0] + "_output_file.txt"  # Create output file name based on input filename
-    output_file = open(result_name, "a")
-    with open(input_file, 'r') as file:
-        for line in file:
-            tokens = line.strip().split('(')
-            command = tokens[0]
-
-            if command == "InsertBook":
-                if len(tokens) == 2:
-                    book_info = tokens[1].replace(")", "").split(',')
-                    book_id = int(book_info[0])
-                    title = book_info[1]
-                    author = book_info[2]
-                    availability = book_info[3]
-                    library.insert_book(book_id, title, author, availability.strip().replace('"', ''))
-
-            elif command == "PrintBook":
-                if len(tokens) == 2:
-                    book_id = int(tokens[1].replace(")", "").strip())
-                    library.print_book(book_id, output_file)
-
-            elif command == "PrintBooks":
-                if len(tokens) == 2:
-                    book_ids = tokens[1].replace(")", "").split(',')
-                    book_id1 = int(book_ids[0].strip())
-                    book_id2 = int(book_ids[1].strip())
-                    library.print_books(book_id1, book_id2, output_file)
-
-            elif command == "BorrowBook":
-                if len(tokens) == 2:
-                    patron_info = tokens[1].replace(")", "").split(',')
-                    patron_id = int(patron_info[0])
-                    book_id = int(patron_info[1])
-                    patron_priority = int(patron_info[2])
-                    library.borrow_book(patron_id, book_id, patron_priority, output_file)
-
-            elif command == "ReturnBook":
-                if len(tokens) == 2:
-                    patron_info = tokens[1].replace(")", "").split(',')
-                    patron_id = int(patron_info[0])
-                    book_id = int(patron_info[1])
-                    library.return_book(patron_id, book_id, output_file)
-
-            elif command == "DeleteBook":
-                if len(tokens) == 2:
-                    book_id = int(tokens[1].replace(")", "").strip())
-                    library.delete_book(book_id, output_file)
-
-            elif command == "FindClosestBook":
-                if len(tokens) == 2:
-                    target_id = int(tokens[1].replace(")", "").strip())
-                    library.find_closest_book(target_id, output_file)
-
-            elif command == "ColorFlipCount":
-                library.color_flip_count(output_file)
-
-            elif command == "Quit":
-                library.quit(output_file)
-                sys.exit(0)
+    parser = argparse.ArgumentParser(description="Run GatorLibrary commands from a file or standard input.")
+    parser.add_argument("input_file", nargs="?", default="-",
+                        help="file of commands; '-' or no file reads standard input and writes standard output")
+    parser.add_argument("--bulk", action="store_true",
+                        help="load runs of consecutive InsertBook commands in a single batch")
+    parser.add_argument("--flush-bytes", type=int, default=1 << 16,
+                        help="how much output to buffer before writing it out (default 64 KiB)")
+    parser.add_argument("--load-snapshot", metavar="PATH", help="start from the books saved in a snapshot file")
+    parser.add_argument("--save-snapshot", metavar="PATH", help="save the library to a snapshot file when done")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:7350", metavar="HOST:PORT",
+                        help="serve commands over TCP instead of reading a file (default 127.0.0.1:7350)")
+    parser.add_argument("--wal", metavar="DIR",
+                        help="recover from and log changes to a write-ahead log and checkpoints in DIR")
+    parser.add_argument("--group-commit", type=int, default=64, metavar="N",
+                        help="sync the write-ahead log after every N logged commands (default 64)")
+    parser.add_argument("--checkpoint-every", type=int, default=100000, metavar="N",
+                        help="checkpoint and truncate the write-ahead log every N logged commands")
+    parser.add_argument("--shards", type=int, default=1, metavar="N",
+                        help="split the books by ID range across N worker processes")
+    parser.add_argument("--key-space", type=int, default=10 ** 6, metavar="MAX",
+                        help="with --shards, the book IDs from 0 to MAX are divided evenly (default 1000000)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="rbtree",
+                        help="the tree that holds the books (default rbtree); "
+                             "ColorFlipCount needs rbtree")
+    parser.add_argument("--persistent", action="store_true",
+                        help="keep every version of the book tree, so the server can run read-only "
+                             "commands on snapshots in parallel with writes")
+    parser.add_argument("--readers", type=int, default=4, metavar="N",
+                        help="with --serve --persistent, threads that run read-only commands (default 4)")
+    parser.add_argument("--metrics", nargs="?", const="", metavar="FILE",
+                        help="collect latency histograms and tree and heap counters for Stats(), "
+                             "and append them to FILE as JSON lines if given")
+    parser.add_argument("--metrics-every", type=int, default=100000, metavar="N",
+                        help="with --metrics FILE, dump the metrics every N commands (default 100000)")
+    parser.add_argument("--profile", metavar="PATH", help="run under cProfile and save the statistics to PATH")
+    parser.add_argument("--sample-ms", type=float, metavar="MS",
+                        help="sample the running function every MS milliseconds and print the hottest on stderr")
+    args = parser.parse_args()
+    if args.shards > 1:
+        if args.serve or args.wal or args.load_snapshot or args.save_snapshot:
+            parser.error("--shards cannot be combined with --serve, --wal or snapshots")
+        if args.metrics is not None or args.profile or args.sample_ms:
+            # The commands run in the worker processes, where none of these can see them.
+            parser.error("--shards cannot be combined with --metrics, --profile or --sample-ms")
+        run_sharded(args)
+        return
+    if args.persistent and args.backend != "rbtree":
+        parser.error("--persistent needs the rbtree backend")
+
+    library = GatorLibrary(args.persistent, args.backend)
+    if args.load_snapshot:
+        from snapshot import load_snapshot
+        load_snapshot(args.load_snapshot, library)
+
+    log = None
+    if args.wal:
+        from wal import WriteAheadLog
+        log = WriteAheadLog(library, args.wal, args.group_commit, args.checkpoint_every)
+        log.recover()
+
+    metrics = None
+    if args.metrics is not None:
+        from metrics import Metrics
+        metrics = Metrics(library, args.metrics or None, args.metrics_every).install()
+    profiler = contextlib.nullcontext()
+    if args.profile or args.sample_ms:
+        from metrics import profiled
+        profiler = profiled(args.profile, args.sample_ms / 1000 if args.sample_ms else None)
+
+    try:
+        with profiler:
+            if args.serve:
+                from server import serve
+                serve(library, args.serve, log, args.readers if args.persistent else 0)
+            elif args.input_file == "-":
+                with OutputWriter(sys.stdout, args.flush_bytes, close_file=False) as output_file:
+                    run_commands(library, sys.stdin, output_file, "<stdin>", args.bulk, log)
+            else:
+                input_file = args.input_file
+                result_name = input_file.split('.')[0] + "_output_file.txt"  # Create output file name based on input filename
+                with open(input_file, 'r') as file, OutputWriter(open(result_name, "a"), args.flush_bytes) as output_file:
+                    run_commands(library, file, output_file, input_file, args.bulk, log)
+    finally:
+        if log:
+            log.close()
+        if metrics:
+            metrics.close()
+
+    if args.save_snapshot:
+        from snapshot import save_snapshot
+        save_snapshot(library, args.save_snapshot)
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
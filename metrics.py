@@ -0,0 +1,279 @@
+"""
+Opt-in instrumentation for GatorLibrary. When enabled, it records:
+
+    - a latency histogram for each command
+    - the time spent parsing commands, working on the tree and heaps, and writing output
+    - the rotations, color flips and heap sifts each command causes
+
+Stats() adds the results to its report, and they can be dumped to a file as JSON lines every so
+many commands. Rotations, flips and sifts are counted by wrapping the RedBlackTree and MinHeap
+methods in place while metrics are installed. Nothing is wrapped otherwise, and run_commands and
+the server only check whether metrics are enabled, so disabled instrumentation costs almost nothing.
+
+Also here is profiled(), which runs a block under cProfile, a sampling profiler, or both.
+"""
+import cProfile
+import collections
+import contextlib
+import json
+import sys
+import threading
+import time
+from minHeap import MinHeap
+from redBlackTree import RedBlackTree
+
+# Each histogram bucket covers 1/32 of a power of two, so percentiles are within about 3%.
+SIGNIFICANT_BITS = 6
+PERCENTILES = (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("p99.9", 0.999))
+
+
+class Histogram:
+    # A histogram of nanosecond latencies in logarithmic buckets, in the style of HdrHistogram.
+    __slots__ = ("counts", "total", "max")
+
+    def __init__(self):
+        self.counts = {}  # Maps the lower bound of each bucket to the number of values in it.
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.total += 1
+        if value > self.max:
+            self.max = value
+        shift = value.bit_length() - SIGNIFICANT_BITS
+        if shift > 0:
+            value = value >> shift << shift
+        self.counts[value] = self.counts.get(value, 0) + 1
+
+    def percentile(self, fraction):
+        # Returns the lower bound of the bucket holding the value at the given fraction of the way up.
+        target = fraction * self.total
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                return bucket
+        return 0
+
+
+class TimedWriter:
+    # Passes writes through to an output file, adding up the time they take.
+    __slots__ = ("file", "metrics")
+
+    def __init__(self, file, metrics):
+        self.file = file
+        self.metrics = metrics
+
+    def write(self, text):
+        started = time.perf_counter_ns()
+        self.file.write(text)
+        self.metrics.output_time += time.perf_counter_ns() - started
+
+
+class CommandMetrics:
+    # Latencies and counters for one kind of command.
+    __slots__ = ("latency", "rotations", "flips", "sifts")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rotations = 0
+        self.flips = 0
+        self.sifts = 0
+
+
+class Metrics:
+    # The RedBlackTree and MinHeap methods wrapped to count calls, and the counter each one adds to.
+    COUNTED_METHODS = (
+        (RedBlackTree, "rotate_left", "rotations"),
+        (RedBlackTree, "rotate_right", "rotations"),
+        (RedBlackTree, "flip_colors", "flips"),
+        (MinHeap, "_bubble_up", "sifts"),
+        (MinHeap, "_bubble_down", "sifts"),
+    )
+
+    def __init__(self, library, dump_path=None, dump_every=100000):
+        """
+        Collects metrics for the commands run against library. If dump_path is given, a JSON line
+        with everything collected so far is appended to it every dump_every commands, and on close.
+        """
+        self.library = library
+        self.dump_path = dump_path
+        self.dump_every = dump_every
+        self.clock = time.perf_counter_ns
+        self.commands = {}  # Maps each command name to its CommandMetrics.
+        self.counters = {"rotations": 0, "flips": 0, "sifts": 0}
+        self.parse_time = 0
+        self.tree_time = 0
+        self.output_time = 0
+        self.command_count = 0
+        self._last_counters = dict(self.counters)
+        self._last_output_time = 0
+        self._originals = []
+
+    def install(self):
+        # Starts counting rotations, flips and sifts, and attaches the metrics to the library.
+        for cls, name, counter in self.COUNTED_METHODS:
+            method = getattr(cls, name)
+            self._originals.append((cls, name, method))
+            setattr(cls, name, self._counting(method, counter))
+        self.library.metrics = self
+        return self
+
+    def _counting(self, method, counter):
+        counters = self.counters
+
+        def counted(*args):
+            counters[counter] += 1
+            return method(*args)
+        return counted
+
+    def close(self):
+        # Restores the original methods and writes a final dump.
+        for cls, name, method in reversed(self._originals):
+            setattr(cls, name, method)
+        self._originals = []
+        self.library.metrics = None
+        if self.dump_path:
+            self.dump()
+
+    def wrap(self, output_file):
+        return TimedWriter(output_file, self)
+
+    def record(self, command, started, parsed):
+        # Records a command that was read at started and had been parsed by parsed.
+        finished = self.clock()
+        entry = self.commands.get(command)
+        if entry is None:
+            entry = self.commands[command] = CommandMetrics()
+        entry.latency.record(finished - started)
+        output_time = self.output_time - self._last_output_time
+        self._last_output_time = self.output_time
+        self.parse_time += parsed - started
+        self.tree_time += finished - parsed - output_time
+
+        counters = self.counters
+        last = self._last_counters
+        entry.rotations += counters["rotations"] - last["rotations"]
+        entry.flips += counters["flips"] - last["flips"]
+        entry.sifts += counters["sifts"] - last["sifts"]
+        self._last_counters = dict(counters)
+
+        self.command_count += 1
+        if self.dump_path and self.command_count % self.dump_every == 0:
+            self.dump()
+
+    def summary(self):
+        # Returns everything collected so far, along with the size of the library. The full
+        # health() walk visits every book, so it is left to Stats() rather than run on every dump.
+        library = self.library
+        commands = {}
+        for command, entry in sorted(self.commands.items()):
+            latency = entry.latency
+            commands[command] = {
+                "count": latency.total,
+                **{label: latency.percentile(fraction) / 1000 for label, fraction in PERCENTILES},
+                "max": latency.max / 1000,
+                "rotations_per_command": entry.rotations / latency.total,
+                "flips_per_command": entry.flips / latency.total,
+                "sifts_per_command": entry.sifts / latency.total,
+            }
+        return {
+            "time": time.time(),
+            "commands": self.command_count,
+            "library": {"books": len(library.book_tree), "patrons": len(library.patrons),
+                        "color_flips": library.book_tree.get_color_flips()},
+            "counters": dict(self.counters),
+            "seconds": {"parse": self.parse_time / 1e9, "tree": self.tree_time / 1e9,
+                        "output": self.output_time / 1e9},
+            "latency_us": commands,
+        }
+
+    def dump(self):
+        with open(self.dump_path, "a") as file:
+            file.write(json.dumps(self.summary()) + "\n")
+
+    def report(self, output_file):
+        # Writes the metrics collected so far for Stats().
+        output_file.write(f"Rotations = {self.counters['rotations']}\nFlips = {self.counters['flips']}\n"
+                          f"Heap sifts = {self.counters['sifts']}\n"
+                          f"Time parsing = {self.parse_time / 1e9:.3f} s, in tree and heaps = "
+                          f"{self.tree_time / 1e9:.3f} s, writing output = {self.output_time / 1e9:.3f} s\n")
+        output_file.write(f"{'Command':<22}{'count':>9}" + "".join(f"{label:>10}" for label, _ in PERCENTILES)
+                          + f"{'max':>10}  latency in us, rotations, flips and sifts per command\n")
+        for command, entry in sorted(self.commands.items()):
+            latency = entry.latency
+            output_file.write(f"{command:<22}{latency.total:>9}"
+                              + "".join(f"{latency.percentile(fraction) / 1000:>10.1f}" for _, fraction in PERCENTILES)
+                              + f"{latency.max / 1000:>10.1f}  {entry.rotations / latency.total:.2f} "
+                              f"{entry.flips / latency.total:.2f} {entry.sifts / latency.total:.2f}\n")
+
+
+class Sampler(threading.Thread):
+    """
+    A sampling profiler: every interval seconds, notes the function the main thread is running
+    and every function on its stack. Cheaper than cProfile on a hot loop, at the cost of precision.
+    """
+
+    def __init__(self, interval):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.thread_id = threading.main_thread().ident
+        self.running = collections.Counter()  # Samples in which each function was running.
+        self.on_stack = collections.Counter()  # Samples in which each function was on the stack.
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.running[self._describe(frame)] += 1
+            seen = set()
+            while frame:
+                seen.add(self._describe(frame))
+                frame = frame.f_back
+            self.on_stack.update(seen)
+
+    @staticmethod
+    def _describe(frame):
+        code = frame.f_code
+        return f"{code.co_filename.rpartition('/')[2]}:{code.co_firstlineno}({code.co_name})"
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self, file, top=15):
+        if not self.samples:
+            return
+        file.write(f"{self.samples} samples\n{'running':>8} {'on stack':>8}  function\n")
+        for function, count in self.running.most_common(top):
+            file.write(f"{100 * count / self.samples:7.1f}% {100 * self.on_stack[function] / self.samples:7.1f}%  {function}\n")
+
+
+@contextlib.contextmanager
+def profiled(profile_path=None, sample_interval=None):
+    """
+    Profiles the block it wraps. With profile_path, cProfile statistics are saved there for
+    pstats or snakeviz. With sample_interval in seconds, a sampling profiler runs alongside and
+    the hottest functions are printed on stderr at the end.
+    """
+    sampler = None
+    if sample_interval:
+        sampler = Sampler(sample_interval)
+        sampler.start()
+    profile = None
+    if profile_path:
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        yield
+    finally:
+        if profile:
+            profile.disable()
+            profile.dump_stats(profile_path)
+        if sampler:
+            sampler.stop()
+            sampler.report(sys.stderr)
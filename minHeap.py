@@ -1,30 +1,60 @@
 class MinHeap:
+    """
+    A min-heap of reservations, each a (patron_id, priority, order) tuple. Lower priority numbers
+    are served first, and reservations with equal priority are served in the order they were made,
+    as recorded by a counter rather than the clock so that ties are always broken the same way.
+    A map from patron ID to heap index lets a patron's reservation be cancelled or re-prioritized
+    in O(log n).
+    """
+    __slots__ = ("heap", "position", "_next_order")
+
     def __init__(self):
         # Initialize the heap with a dummy element at index 0 for easier index calculations.
         self.heap = [None]
+        self.position = {}  # Maps each patron ID to the index of their reservation in the heap.
+        self._next_order = 0
+
+    def __len__(self):
+        return len(self.heap) - 1
+
+    def __contains__(self, patron_id):
+        return patron_id in self.position
+
+    def reserve(self, patron_id, priority):
+        """
+        Adds a reservation for the patron, ordered after every reservation made before it.
+        Returns False, and leaves the heap unchanged, if the patron already has a reservation.
+        """
+        if patron_id in self.position:
+            return False
+        self.insert((patron_id, priority, self._next_order))
+        return True
 
     def insert(self, reservation):
         # Add the new reservation to the end of the heap.
         self.heap.append(reservation)
+        self._next_order = max(self._next_order, reservation[2] + 1)
         # Restore the heap property by moving the new reservation up as necessary.
         self._bubble_up(len(self.heap) - 1)
 
     def _bubble_up(self, idx):
-        # Base case: if we're at the root of the heap, do nothing.
-        if idx <= 1:
-            return
-        # Calculate the parent's index.
-        parent_idx = idx // 2
-        if self.heap[parent_idx] is not None:
-            # Compare the priorities of the current node and its parent.
-            parent_priority = self.heap[parent_idx][1]
-            current_priority = self.heap[idx][1]
-            # Swap with the parent if the current node has a higher priority.
-            if current_priority < parent_priority or (
-                    current_priority == parent_priority and self.heap[idx][2] < self.heap[parent_idx][2]):
-                self.heap[parent_idx], self.heap[idx] = self.heap[idx], self.heap[parent_idx]
-                # Continue bubbling up.
-                self._bubble_up(parent_idx)
+        # Moves the reservation at idx up until its parent comes before it. Rather than swapping at
+        # every level, parents are shifted down into the gap and the reservation is placed once.
+        heap = self.heap
+        position = self.position
+        reservation = heap[idx]
+        priority, order = reservation[1], reservation[2]
+        while idx > 1:
+            parent_idx = idx >> 1
+            parent = heap[parent_idx]
+            if priority < parent[1] or (priority == parent[1] and order < parent[2]):
+                heap[idx] = parent
+                position[parent[0]] = idx
+                idx = parent_idx
+            else:
+                break
+        heap[idx] = reservation
+        position[reservation[0]] = idx
 
     def extract_min(self):
         # If the heap is empty, return None.
@@ -32,36 +62,97 @@ class MinHeap:
             return None
         # The smallest element is at the root of the heap.
         min_reservation = self.heap[1]
+        del self.position[min_reservation[0]]
         # Replace the root with the last element in the heap.
-        self.heap[1] = self.heap[-1]
-        self.heap.pop()
-        # Restore the heap property by moving the new root down as necessary.
-        self._bubble_down(1)
+        last = self.heap.pop()
+        if len(self.heap) > 1:
+            self.heap[1] = last
+            # Restore the heap property by moving the new root down as necessary.
+            self._bubble_down(1)
         return min_reservation
 
     def _bubble_down(self, idx):
-        smallest = idx
-        left_idx = 2 * idx  # Index of left child
-        right_idx = 2 * idx + 1  # Index of right child
+        # Moves the reservation at idx down until both children come after it, shifting the
+        # smaller child up into the gap at each level.
+        heap = self.heap
+        position = self.position
+        size = len(heap)
+        reservation = heap[idx]
+        priority, order = reservation[1], reservation[2]
+        child_idx = 2 * idx
+        while child_idx < size:
+            child = heap[child_idx]
+            # Pick whichever child comes first.
+            if child_idx + 1 < size:
+                right = heap[child_idx + 1]
+                if right[1] < child[1] or (right[1] == child[1] and right[2] < child[2]):
+                    child_idx += 1
+                    child = right
+            if child[1] < priority or (child[1] == priority and child[2] < order):
+                heap[idx] = child
+                position[child[0]] = idx
+                idx = child_idx
+                child_idx = 2 * idx
+            else:
+                break
+        heap[idx] = reservation
+        position[reservation[0]] = idx
 
-        # Check if the left child exists and has higher priority than the current node.
-        if left_idx < len(self.heap) and self.heap[left_idx]:
-            if self.heap[left_idx][1] < self.heap[smallest][1] or (
-                    self.heap[left_idx][1] == self.heap[smallest][1] and self.heap[left_idx][2] < self.heap[smallest][
-                2]):
-                smallest = left_idx
+    def _restore(self, idx):
+        # Moves the reservation at idx up or down, whichever its new priority calls for.
+        if idx > 1:
+            parent = self.heap[idx >> 1]
+            reservation = self.heap[idx]
+            if reservation[1] < parent[1] or (reservation[1] == parent[1] and reservation[2] < parent[2]):
+                self._bubble_up(idx)
+                return
+        self._bubble_down(idx)
 
-        # Check if the right child exists and has higher priority than the current node.
-        if right_idx < len(self.heap) and self.heap[right_idx]:
-            if self.heap[right_idx][1] < self.heap[smallest][1] or (
-                    self.heap[right_idx][1] == self.heap[smallest][1] and self.heap[right_idx][2] < self.heap[smallest][
-                2]):
-                smallest = right_idx
+    def cancel(self, patron_id):
+        # Removes the patron's reservation and returns it, or returns None if they have none.
+        idx = self.position.pop(patron_id, None)
+        if idx is None:
+            return None
+        reservation = self.heap[idx]
+        last = self.heap.pop()
+        if idx < len(self.heap):
+            # Fill the gap with the last reservation and move it to where it belongs.
+            self.heap[idx] = last
+            self._restore(idx)
+        return reservation
+
+    def update_priority(self, patron_id, priority):
+        """
+        Changes the priority of the patron's reservation, keeping its original place among
+        reservations of the same priority. Returns False if the patron has no reservation.
+        """
+        idx = self.position.get(patron_id)
+        if idx is None:
+            return False
+        self.heap[idx] = (patron_id, priority, self.heap[idx][2])
+        self._restore(idx)
+        return True
+
+    def heapify(self, reservations):
+        """
+        Replaces the contents of the heap with the given (patron_id, priority, order) reservations
+        in O(n), for example when restoring a saved queue.
+        """
+        self.heap = [None]
+        self.heap.extend(reservations)
+        self.position = {reservation[0]: idx for idx, reservation in enumerate(self.heap) if reservation}
+        self._next_order = max((reservation[2] + 1 for reservation in self.heap[1:]), default=0)
+        # Sift down every internal node, starting from the last one.
+        for idx in range((len(self.heap) - 1) // 2, 0, -1):
+            self._bubble_down(idx)
 
-        # If either child has higher priority, swap with that child and continue down the heap.
-        if smallest != idx:
-            self.heap[idx], self.heap[smallest] = self.heap[smallest], self.heap[idx]
-            self._bubble_down(smallest)
+    def copy(self):
+        # Returns an independent copy of the heap, in O(n).
+        other = MinHeap()
+        other.heap = self.heap[:]
+        other.position = self.position.copy()
+        other._next_order = self._next_order
+        return other
 
     def is_empty(self):
         # The heap is empty if it only contains the dummy element.
@@ -0,0 +1,117 @@
+from redBlackTree import Node, RedBlackTree
+
+
+class PersistentRedBlackTree(RedBlackTree):
+    """
+    A RedBlackTree whose writes never change a node that an earlier version of the tree can
+    reach. Before a write, every node on its search path is replaced with a copy, and any other
+    node a rotation or color flip is about to change is copied when it is reached, so the write
+    runs the usual balancing code on private nodes and ends with a new root. A snapshot is just an
+    old root: it goes on seeing the tree exactly as it was, can be read from other threads without
+    any locking, and its nodes are freed as soon as no snapshot refers to them.
+
+    A write copies O(log n) nodes, and the tree is shaped, and counts color flips, exactly like
+    a RedBlackTree given the same operations. Keys are shared between versions, so callers must
+    not change a key in place except through get_for_update, which hands out a private copy.
+    """
+    copies_on_update = True
+
+    def __init__(self):
+        super().__init__()
+        self._owned = set()  # ids of the nodes copied during the current write.
+
+    def snapshot(self):
+        """
+        Returns a read-only RedBlackTree holding the current version. Take snapshots between
+        writes, from the thread making them; the snapshot itself can then be used anywhere.
+        """
+        frozen = RedBlackTree()
+        frozen.root = self.root
+        frozen.color_flips = self.color_flips
+        return frozen
+
+    def _own(self, node):
+        # Returns node if this write already owns it, or else a private copy of it.
+        if node is None or id(node) in self._owned:
+            return node
+        copy = Node(node.key, node.value, node.color)
+        copy.left = node.left
+        copy.right = node.right
+        copy.size = node.size
+        self._owned.add(id(copy))
+        return copy
+
+    def _copy_path(self, key, to_successor):
+        """
+        Replaces the nodes on the search path for key with copies and returns the copy of the node
+        holding key, or None. With to_successor, the path carries on to the successor of a node
+        with two children, which is where a delete ends up.
+        """
+        self._owned.clear()
+        node = self.root = self._own(self.root)
+        found = None
+        while node:
+            if key < node.key.book_id:
+                node.left = child = self._own(node.left)
+            elif key > node.key.book_id:
+                node.right = child = self._own(node.right)
+            else:
+                found = node
+                if to_successor and node.left and node.right:
+                    # Follow the leftmost path of the right subtree down to the successor.
+                    node.right = node = self._own(node.right)
+                    while node.left:
+                        node.left = node = self._own(node.left)
+                break
+            node = child
+        return found
+
+    def rotate_left(self, node):
+        node.right = self._own(node.right)
+        return super().rotate_left(node)
+
+    def rotate_right(self, node):
+        node.left = self._own(node.left)
+        return super().rotate_right(node)
+
+    def flip_colors(self, node):
+        node.left = self._own(node.left)
+        node.right = self._own(node.right)
+        super().flip_colors(node)
+
+    def put(self, key, value=None):
+        self._copy_path(key.book_id, False)
+        super().put(key, value)
+        self._owned.clear()
+
+    def delete(self, key):
+        self._copy_path(key, True)
+        super().delete(key)
+        self._owned.clear()
+
+    def get_for_update(self, key):
+        # Copies the path to the node and gives it a copy of its key, which the caller may change.
+        # Nothing is rebalanced afterwards, so the copies need not be tracked.
+        if not self.get(key):
+            return None
+        node = self.root
+        parent = None
+        while True:
+            copy = Node(node.key, node.value, node.color)
+            copy.left = node.left
+            copy.right = node.right
+            copy.size = node.size
+            if parent is None:
+                self.root = copy
+            elif key < parent.key.book_id:
+                parent.left = copy
+            else:
+                parent.right = copy
+            if key < node.key.book_id:
+                node = node.left
+            elif key > node.key.book_id:
+                node = node.right
+            else:
+                copy.key = copy.key.copy()
+                return copy
+            parent = copy
@@ -1,13 +1,23 @@
+from bookTree import BookTree
+
+# Node colors are stored as booleans rather than strings to keep each node small.
+RED = True
+BLACK = False
+
+
 class Node:
-    def __init__(self, key, value=None, color="RED"):
+    __slots__ = ("key", "value", "left", "right", "color", "size")
+
+    def __init__(self, key, value=None, color=RED):
         self.key = key
         self.value = value
         self.left = None
         self.right = None
         self.color = color
+        self.size = 1  # Number of nodes in the subtree rooted here, for rank and select queries.
 
 
-class RedBlackTree:
+class RedBlackTree(BookTree):
     def __init__(self):
         self.root = None
         self.color_flips = 0  # Initialize the color flip counter
@@ -16,7 +26,14 @@ class RedBlackTree:
         # returns True if the given node is red, False otherwise.
         if not node:
             return False
-        return node.color == "RED"
+        return node.color == RED
+
+    def _size(self, node):
+        # returns the number of nodes in the subtree rooted at the given node.
+        return node.size if node else 0
+
+    def __len__(self):
+        return self._size(self.root)
 
     def rotate_left(self, node):
         # performs a left rotation on the given node and its right child, and returns the new root of the subtree.
@@ -24,7 +41,9 @@ class RedBlackTree:
         node.right = right.left
         right.left = node
         right.color = node.color
-        node.color = "RED"
+        node.color = RED
+        right.size = node.size
+        node.size = 1 + self._size(node.left) + self._size(node.right)
         if self.is_red(node.right) and not self.is_red(node.left):
             self.color_flips += 1
         return right
@@ -35,16 +54,18 @@ class RedBlackTree:
         node.left = left.right
         left.right = node
         left.color = node.color
-        node.color = "RED"
+        node.color = RED
+        left.size = node.size
+        node.size = 1 + self._size(node.left) + self._size(node.right)
         if self.is_red(node.left) and self.is_red(node.left.left):
             self.color_flips += 1
         return left
 
     def flip_colors(self, node):
         # flips the colors of the given node and its two children.
-        node.color = "RED"
-        node.left.color = "BLACK"
-        node.right.color = "BLACK"
+        node.color = RED
+        node.left.color = BLACK
+        node.right.color = BLACK
         if self.is_red(node.left) and self.is_red(node.right):
             self.color_flips += 1
 
@@ -53,33 +74,66 @@ class RedBlackTree:
         inserts a new node with the given key and value (if specified) into the tree. 
         If the key already exists in the tree, its value is updated.
         """
-        self.root = self._put(self.root, key, value)
-        self.root.color = "BLACK"
-
-    def _put(self, node, key, value=None):
-        # is a helper function for put() that inserts a new node into the subtree rooted at the given node.
-        if not node:
-            return Node(key, value)
-
-        if key.book_id < node.key.book_id:
-            node.left = self._put(node.left, key, value)
-        elif key.book_id > node.key.book_id:
-            node.right = self._put(node.right, key, value)
+        # Walk down to the insertion point, remembering each node and which way we went.
+        path = []
+        node = self.root
+        while node:
+            if key.book_id < node.key.book_id:
+                path.append((node, True))
+                node = node.left
+            elif key.book_id > node.key.book_id:
+                path.append((node, False))
+                node = node.right
+            else:
+                node.value = value
+                node = self._balance(node)
+                break
         else:
-            node.key.value = value
+            node = Node(key, value)
 
-        if self.is_red(node.right) and not self.is_red(node.left):
+        self.root = self._rebalance_path(path, node)
+        self.root.color = BLACK
+
+    def _balance(self, node):
+        # restores the left-leaning red-black shape at the given node and returns the new subtree root.
+        # This runs once per level on every insert and delete, so the is_red checks are inlined
+        # (a node is red exactly when it exists and its color is True).
+        left = node.left
+        right = node.right
+        if right and right.color and not (left and left.color):
             node = self.rotate_left(node)
             self.color_flips += 1
-        if self.is_red(node.left) and self.is_red(node.left.left):
+            left = node.left
+            right = node.right
+        if left and left.color and left.left and left.left.color:
             node = self.rotate_right(node)
             self.color_flips += 1
-        if self.is_red(node.left) and self.is_red(node.right):
+            left = node.left
+            right = node.right
+        if left and left.color and right and right.color:
             self.flip_colors(node)
             self.color_flips += 1
 
         return node
 
+    def _rebalance_path(self, path, node):
+        """
+        Re-links node as the child of the last node on the path, then updates the subtree size
+        of and balances each node on the path from the bottom up, and returns the new root.
+        """
+        while path:
+            parent, went_left = path.pop()
+            if went_left:
+                parent.left = node
+                right = parent.right
+                parent.size = 1 + (node.size if node else 0) + (right.size if right else 0)
+            else:
+                parent.right = node
+                left = parent.left
+                parent.size = 1 + (left.size if left else 0) + (node.size if node else 0)
+            node = self._balance(parent)
+        return node
+
     def get(self, key):
         # returns the value associated with the given key in the tree, or None if the key is not found.
         node = self.root
@@ -93,40 +147,128 @@ class RedBlackTree:
 
         return None
 
-    def delete(self, key):
-        # removes the node with the given key from the tree.
-        self.root = self._delete(self.root, key)
+    # Returns the node holding the key, for a caller about to change the key object in place.
+    # Trees that share nodes between versions override this to hand out a private copy.
+    get_for_update = get
 
-    def _delete(self, node, key):
-        # is a helper function for delete() that removes the node with the given key from the subtree rooted at the given node.
-        if not node:
+    def floor(self, key):
+        # returns the node with the largest key less than or equal to the given key, or None.
+        best = None
+        node = self.root
+        while node:
+            if key == node.key.book_id:
+                return node
+            elif key < node.key.book_id:
+                node = node.left
+            else:
+                best = node
+                node = node.right
+        return best
+
+    def ceiling(self, key):
+        # returns the node with the smallest key greater than or equal to the given key, or None.
+        best = None
+        node = self.root
+        while node:
+            if key == node.key.book_id:
+                return node
+            elif key > node.key.book_id:
+                node = node.right
+            else:
+                best = node
+                node = node.left
+        return best
+
+    def predecessor(self, node):
+        # returns the node that comes just before the given node in key order, or None.
+        if node.left:
+            node = node.left
+            while node.right:
+                node = node.right
+            return node
+        # Nodes have no parent links, so find the nearest ancestor we turned right at.
+        key = node.key.book_id
+        best = None
+        current = self.root
+        while current and current is not node:
+            if key < current.key.book_id:
+                current = current.left
+            else:
+                best = current
+                current = current.right
+        return best
+
+    def successor(self, node):
+        # returns the node that comes just after the given node in key order, or None.
+        if node.right:
+            return self._get_min(node.right)
+        # Nodes have no parent links, so find the nearest ancestor we turned left at.
+        key = node.key.book_id
+        best = None
+        current = self.root
+        while current and current is not node:
+            if key > current.key.book_id:
+                current = current.right
+            else:
+                best = current
+                current = current.left
+        return best
+
+    def rank(self, key):
+        # returns the number of keys in the tree that are less than the given key.
+        rank = 0
+        node = self.root
+        while node:
+            if key <= node.key.book_id:
+                node = node.left
+            else:
+                rank += 1 + self._size(node.left)
+                node = node.right
+        return rank
+
+    def select(self, index):
+        # returns the node with the given zero-based position in key order, or None if out of range.
+        if index < 0:
             return None
-        if key < node.key.book_id:
-            node.left = self._delete(node.left, key)
-        elif key > node.key.book_id:
-            node.right = self._delete(node.right, key)
-        else:
-            if not node.left:
-                return node.right
+        node = self.root
+        while node:
+            left_size = self._size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index > left_size:
+                index -= left_size + 1
+                node = node.right
+            else:
+                return node
+        return None
+
+    def delete(self, key):
+        # removes the node with the given key from the tree.
+        path = []
+        node = self.root
+        while node:
+            if key < node.key.book_id:
+                path.append((node, True))
+                node = node.left
+            elif key > node.key.book_id:
+                path.append((node, False))
+                node = node.right
+            elif not node.left:
+                node = node.right
+                break
             elif not node.right:
-                return node.left
+                node = node.left
+                break
             else:
+                # Replace the key with its successor, then carry on down to remove the successor.
                 successor = self._get_min(node.right)
                 node.key = successor.key
                 node.value = successor.value
-                node.right = self._delete(node.right, successor.key.book_id)
-
-        if self.is_red(node.right) and not self.is_red(node.left):
-            node = self.rotate_left(node)
-            self.color_flips += 1
-        if self.is_red(node.left) and self.is_red(node.left.left):
-            node = self.rotate_right(node)
-            self.color_flips += 1
-        if self.is_red(node.left) and self.is_red(node.right):
-            self.flip_colors(node)
-            self.color_flips += 1
+                key = successor.key.book_id
+                path.append((node, False))
+                node = node.right
 
-        return node
+        self.root = self._rebalance_path(path, node)
 
     def _get_min(self, node):
         # returns the node with the minimum key in the subtree rooted at the given node.
@@ -134,25 +276,140 @@ class RedBlackTree:
             node = node.left
         return node
 
-    def inorder_traversal(self, start_key, end_key):
+    def iter_range(self, start_key, end_key, reverse=False, limit=None):
         """
-        Returns a list of nodes in the tree, in order, from start_key to end_key (inclusive).
+        Yields the nodes with keys from start_key to end_key (inclusive) one at a time, in
+        increasing order of book_id, or decreasing order if reverse is set, stopping after limit
+        nodes if a limit is given. Only a stack of O(log n) nodes is kept between yields. The tree
+        must not be modified while the iteration is in progress.
         """
-        nodes = []
-        self._inorder_traversal(self.root, start_key, end_key, nodes)
-        return nodes
-
-    def _inorder_traversal(self, node, start_key, end_key, nodes):
-        if not node:
+        if limit is not None and limit <= 0:
             return
-        if start_key < node.key.book_id:
-            self._inorder_traversal(node.left, start_key, end_key, nodes)
+        stack = []
+        node = self.root
+        while stack or node:
+            if node:
+                # Only descend into subtrees that can hold keys inside the range.
+                stack.append(node)
+                if reverse:
+                    node = node.right if end_key > node.key.book_id else None
+                else:
+                    node = node.left if start_key < node.key.book_id else None
+                continue
+            node = stack.pop()
+            if start_key <= node.key.book_id <= end_key:
+                yield node
+                if limit is not None:
+                    limit -= 1
+                    if limit == 0:
+                        return
+            if reverse:
+                node = node.left if start_key < node.key.book_id else None
+            else:
+                node = node.right if end_key > node.key.book_id else None
 
-        if start_key <= node.key.book_id and end_key >= node.key.book_id:
-            nodes.append(node)
+    def bulk_load(self, keys):
+        """
+        Replaces the contents of the tree with the given keys, which must already be sorted by
+        book_id with no duplicates. The tree is built bottom-up in O(n) as a valid left-leaning
+        red-black tree. No rotations or color flips are performed, so the color flip counter is
+        left unchanged.
+        """
+        n = len(keys)
+        # The black height of the tree; any n in [2^h - 1, 3^h - 1] can be built with height h.
+        black_height = (n + 1).bit_length() - 1
+        self.root = self._build(keys, 0, n, black_height)
+        if self.root:
+            self.root.color = BLACK
+
+    def _build(self, keys, lo, hi, black_height):
+        # builds a subtree with the given black height from keys[lo:hi], returning its root.
+        count = hi - lo
+        if count == 0:
+            return None
+        if black_height == 1:
+            # The bottom level holds one or two keys, so build it directly rather than recursing.
+            node = Node(keys[hi - 1], color=BLACK)
+            if count == 2:
+                node.left = Node(keys[lo], color=RED)
+                node.size = 2
+            return node
+
+        # Each child subtree has black height one less and holds at most max_child keys.
+        max_child = 3 ** (black_height - 1) - 1
+        if count - 1 <= 2 * max_child:
+            # A 2-node: a black node with two black children.
+            rest = count - 1
+            mid = lo + rest - rest // 2
+            node = Node(keys[mid], color=BLACK)
+            node.left = self._build(keys, lo, mid, black_height - 1)
+            node.right = self._build(keys, mid + 1, hi, black_height - 1)
+            node.size = count
+            return node
+
+        # A 3-node: a black node whose left child is red, with three black grandchildren.
+        rest = count - 2
+        first = lo + (rest + 2) // 3
+        second = first + 1 + (rest + 1) // 3
+        red = Node(keys[first], color=RED)
+        red.left = self._build(keys, lo, first, black_height - 1)
+        red.right = self._build(keys, first + 1, second, black_height - 1)
+        red.size = second - lo
+        node = Node(keys[second], color=BLACK)
+        node.left = red
+        node.right = self._build(keys, second + 1, hi, black_height - 1)
+        node.size = count
+        return node
+
+    def check_invariants(self):
+        """
+        Returns True if the tree is a valid left-leaning red-black tree: keys are in search order,
+        the root is black, no node has a red right child or two red links in a row, every
+        path from the root to a leaf has the same number of black nodes, and every subtree size
+        is correct.
+        """
+        if self.is_red(self.root):
+            return False
+        black_heights = {}
+        stack = [(self.root, None, None, False)]
+        while stack:
+            node, low, high, visited = stack.pop()
+            if not node:
+                continue
+            book_id = node.key.book_id
+            if not visited:
+                if (low is not None and book_id <= low) or (high is not None and book_id >= high):
+                    return False
+                if self.is_red(node.right):
+                    return False
+                if self.is_red(node) and self.is_red(node.left):
+                    return False
+                if node.size != 1 + self._size(node.left) + self._size(node.right):
+                    return False
+                # Visit the children first so their black heights are known when we come back.
+                stack.append((node, low, high, True))
+                stack.append((node.left, low, book_id, False))
+                stack.append((node.right, book_id, high, False))
+            else:
+                left_height = black_heights.pop(id(node.left), 0)
+                right_height = black_heights.pop(id(node.right), 0)
+                if left_height != right_height:
+                    return False
+                black_heights[id(node)] = left_height + (0 if self.is_red(node) else 1)
+        return True
 
-        if end_key > node.key.book_id:
-            self._inorder_traversal(node.right, start_key, end_key, nodes)
+    def height(self):
+        # returns the number of nodes on the longest path from the root to a leaf. Visits every node.
+        height = 0
+        stack = [(self.root, 1)] if self.root else []
+        while stack:
+            node, depth = stack.pop()
+            height = max(height, depth)
+            if node.left:
+                stack.append((node.left, depth + 1))
+            if node.right:
+                stack.append((node.right, depth + 1))
+        return height
 
     def get_color_flips(self):
         return self.color_flips
\ No newline at end of file
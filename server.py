@@ -0,0 +1,231 @@
+"""
+A TCP front end for GatorLibrary. Clients send the same commands as the input files, one per line,
+and may pipeline as many as they like without waiting for replies. Each reply is the text the
+command writes to the output file, followed by a line holding a single '.', so that clients can
+tell where one reply ends. A malformed line gets an 'Error: ...' reply.
+
+All commands run on one GatorLibrary inside the event loop, so they are applied one at a time in
+the order they arrive, with no locking. Everything a client has sent is read in one go, run, and
+the replies sent back in a single write. With a persistent library and reader threads, read-only
+commands instead run on a snapshot taken when they arrive, on a thread pool, so a long PrintBooks
+does not hold up the writes that come after it.
+
+Run a server with 'python library.py --serve [HOST:PORT]', and load it from another terminal with
+'python server.py --connections 8 --requests 20000 --pipeline 16 [HOST:PORT]'.
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from library import CommandError, execute_command, parse_command, MUTATING_COMMANDS, SNAPSHOT_COMMANDS
+
+DEFAULT_ADDRESS = "127.0.0.1:7350"
+END_OF_REPLY = ".\n"
+READ_SIZE = 1 << 16
+
+
+def parse_address(address):
+    # Splits 'host:port' into a (host, port) pair.
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class ReplyBuffer:
+    # Collects the replies to a batch of commands, in the form the output file methods expect.
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def end_reply(self):
+        # Closes the current reply, making sure the terminator starts on its own line. A deferred
+        # reply is already complete, so it always ends a line.
+        if self.parts and isinstance(self.parts[-1], str) and not self.parts[-1].endswith("\n"):
+            self.parts.append("\n")
+        self.parts.append(END_OF_REPLY)
+
+    def defer(self, future):
+        # Adds a complete reply that is still being worked out on a reader thread.
+        self.parts.append(future)
+
+    async def take(self):
+        # Waits for any deferred replies and returns the whole batch, in order, as bytes.
+        parts = self.parts
+        self.parts = []
+        texts = [part if isinstance(part, str) else await part for part in parts]
+        return "".join(texts).encode("utf-8")
+
+
+def run_on_snapshot(snapshot, command, arguments):
+    # Runs a read-only command on a library snapshot, returning its complete reply.
+    replies = ReplyBuffer()
+    execute_command(snapshot, command, arguments, replies)
+    replies.end_reply()
+    return "".join(replies.parts)
+
+
+class LibraryServer:
+    def __init__(self, library, log=None, readers=0):
+        self.library = library
+        self.log = log
+        # Threads for read-only commands; only used with a persistent library.
+        self.pool = ThreadPoolExecutor(readers) if readers else None
+
+    def run_batch(self, lines, replies):
+        # Runs a batch of command lines, returning False if the client asked to quit.
+        metrics = self.library.metrics
+        output_file = metrics.wrap(replies) if metrics else replies
+        for line in lines:
+            started = metrics.clock() if metrics else None
+            try:
+                parsed = parse_command(line)
+            except CommandError as error:
+                replies.write(f"Error: {error}")
+                replies.end_reply()
+                continue
+            if parsed is None:
+                continue
+            command, arguments = parsed
+            if self.pool and command in SNAPSHOT_COMMANDS:
+                reply = asyncio.get_running_loop().run_in_executor(
+                    self.pool, run_on_snapshot, self.library.snapshot(), command, arguments)
+                if metrics:
+                    # Recorded back on the event loop once the reply is ready, so its time includes
+                    # any wait for a free reader thread.
+                    ready = metrics.clock()
+                    reply.add_done_callback(lambda _, command=command, started=started, ready=ready:
+                                            metrics.record(command, started, ready))
+                replies.defer(reply)
+                continue
+            if self.log and command in MUTATING_COMMANDS:
+                self.log.append(line)
+            ready = metrics.clock() if metrics else None
+            execute_command(self.library, command, arguments, output_file)
+            if metrics:
+                metrics.record(command, started, ready)
+            replies.end_reply()
+            if command == "Quit":
+                return False
+            if self.log:
+                self.log.maybe_checkpoint()
+        return True
+
+    async def handle_client(self, reader, writer):
+        replies = ReplyBuffer()
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                # Run every complete line received so far, keeping any partial line for later.
+                *lines, pending = (pending + data).split(b"\n")
+                keep_going = self.run_batch([line.decode("utf-8", "replace") for line in lines], replies)
+                if self.log:
+                    # Replies are only sent once the commands they answer are durable.
+                    self.log.commit()
+                writer.write(await replies.take())
+                await writer.drain()
+                if not keep_going:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def serve(library, address=DEFAULT_ADDRESS, log=None, readers=0):
+    # Serves the library on address until interrupted, running read-only commands on readers threads if any.
+    host, port = parse_address(address)
+    print(f"GatorLibrary listening on {host}:{port}")
+    try:
+        asyncio.run(LibraryServer(library, log, readers).serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+async def load_client(host, port, commands, pipeline, latencies):
+    # Sends commands over one connection, keeping up to pipeline of them in flight.
+    reader, writer = await asyncio.open_connection(host, port)
+    sent_at = []
+    next_command = 0
+    received = 0
+    while received < len(commands):
+        # Top up the pipeline, then wait for the next reply.
+        batch = []
+        while next_command < len(commands) and next_command - received < pipeline:
+            batch.append(commands[next_command])
+            sent_at.append(time.perf_counter())
+            next_command += 1
+        if batch:
+            writer.write("".join(batch).encode("utf-8"))
+        line = await reader.readline()
+        if not line:
+            break
+        if line == END_OF_REPLY.encode():
+            latencies.append(time.perf_counter() - sent_at[received])
+            received += 1
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_load(address, connections, requests, pipeline, books, seed):
+    """
+    Loads the catalog with books, then drives the server from several connections with a mix
+    of lookups, range queries, borrows and returns, and reports throughput and latency.
+    """
+    host, port = parse_address(address)
+    rng = random.Random(seed)
+    setup = [f'InsertBook({book_id}, "Title {book_id}", "Author {book_id % 100}", "Yes")\n'
+             for book_id in range(books)]
+    await load_client(host, port, setup, 256, [])
+
+    workloads = []
+    for _ in range(connections):
+        commands = []
+        for _ in range(requests):
+            choice = rng.random()
+            book_id = rng.randrange(books)
+            if choice < 0.4:
+                commands.append(f"PrintBook({book_id})\n")
+            elif choice < 0.7:
+                commands.append(f"BorrowBook({rng.randint(1, 1000)}, {book_id}, {rng.randint(1, 5)})\n")
+            elif choice < 0.9:
+                commands.append(f"ReturnBook({rng.randint(1, 1000)}, {book_id})\n")
+            else:
+                commands.append(f"PrintBooks({book_id}, {book_id + 10})\n")
+        workloads.append(commands)
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(load_client(host, port, commands, pipeline, latencies) for commands in workloads))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} commands in {elapsed:.2f} s: {len(latencies) / elapsed:.0f} commands/s")
+    for label, fraction in (("p50", 0.5), ("p99", 0.99), ("max", 1.0)):
+        index = min(len(latencies) - 1, int(fraction * len(latencies)))
+        print(f"  {label} latency {latencies[index] * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for a GatorLibrary server.")
+    parser.add_argument("address", nargs="?", default=DEFAULT_ADDRESS, help="server host:port")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=10000, help="commands sent per connection")
+    parser.add_argument("--pipeline", type=int, default=16, help="commands in flight per connection")
+    parser.add_argument("--books", type=int, default=10000, help="books to insert before the run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run_load(args.address, args.connections, args.requests, args.pipeline, args.books, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+A GatorLibrary split across several worker processes by ranges of book ID, so that commands on
+different books can run on several cores at once. Shard i holds the books whose IDs fall between
+boundaries[i - 1] and boundaries[i], each in its own GatorLibrary.
+
+The router in the parent process parses every command. Commands about a single book are sent to
+the shard that owns it, in batches, and their output is written back in the order the commands
+were read. Commands that span shards (PrintBooks, FindClosestBook, PrintPatron, ...) first wait for
+every batch sent before them, then ask each shard for its part and combine the answers, so the
+output is the same as that of a single GatorLibrary. The exception is ColorFlipCount, which is
+the sum over the shards' trees and so differs from the count of one tree holding every book.
+
+A shard that grows too large can be split in two at a book ID: the owning worker hands the upper
+half of its library to a new worker through a snapshot file.
+"""
+import bisect
+import heapq
+import multiprocessing
+import os
+import sys
+import tempfile
+from library import CommandError, GatorLibrary, execute_command, parse_command
+from snapshot import load_snapshot, save_snapshot
+
+# Commands about one book, and the position of the book ID among their arguments.
+ROUTED_COMMANDS = {
+    "InsertBook": 0,
+    "PrintBook": 0,
+    "DeleteBook": 0,
+    "BorrowBook": 1,
+    "ReturnBook": 1,
+    "CancelReservation": 1,
+    "UpdatePriority": 1,
+}
+BATCH_SIZE = 1024  # Commands sent to a shard in one message.
+FLUSH_EVERY = 1 << 16  # Routed commands whose output may be held before it is written.
+
+
+class OutputCollector:
+    # Collects the output of each command in a batch separately.
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+
+def _run_batch(library, commands, bulk):
+    # Runs a batch of parsed commands, returning the output of each one.
+    collector = OutputCollector()
+    outputs = []
+    pending_books = []
+    for command, arguments in commands:
+        if bulk and command == "InsertBook":
+            pending_books.append(arguments)
+            outputs.append("")
+            continue
+        if pending_books:
+            library.bulk_insert_books(pending_books)
+            pending_books = []
+        execute_command(library, command, arguments, collector)
+        outputs.append(collector.take())
+    if pending_books:
+        library.bulk_insert_books(pending_books)
+    return outputs
+
+
+def _query_range(library, book_id1, book_id2):
+    return [node.key.render() for node in library.book_tree.iter_range(book_id1, book_id2)]
+
+
+def _query_page(library, book_id1, book_id2, offset, limit):
+    # The page of books in the range that starts offset books in, as print_books_page finds it.
+    tree = library.book_tree
+    start = tree.select(tree.rank(book_id1) + offset)
+    if not start:
+        return []
+    return [node.key.render() for node in tree.iter_range(start.key.book_id, book_id2, limit=limit)]
+
+
+def _query_rank(library, book_id):
+    # The number of books before book_id, or None if the book is not in this shard.
+    return library.book_tree.rank(book_id) if library.book_tree.get(book_id) else None
+
+
+def _query_select(library, index):
+    node = library.book_tree.select(index)
+    return node.key.render() if node else None
+
+
+def _query_closest(library, target_id):
+    return [(book.book_id, book.render()) for book in library.closest_books(target_id)]
+
+
+def _query_nearest(library, target_id, k):
+    return [(book.book_id, book.render()) for book in library.nearest_books(target_id, k)]
+
+
+def _query_patron(library, patron_id):
+    patron = library.patrons.get(patron_id)
+    return (sorted(patron.borrowed), sorted(patron.reserved)) if patron else ([], [])
+
+
+def _query_author(library, author_name):
+    return [book.render() for _, book in library.author_index.get(author_name, ())]
+
+
+def _query_title_prefix(library, prefix):
+    # Each book with its (title, book_id) sort key, so the shards' answers can be merged.
+    return [((title, book_id), book.render()) for title, book_id, book in library.title_index.iter_prefix(prefix)]
+
+
+def _query_cancel_all(library, patron_id):
+    # Cancels the patron's reservations in this shard, returning the IDs of the books involved.
+    patron = library.patrons.get(patron_id)
+    book_ids = sorted(patron.reserved) if patron else []
+    for book_id in book_ids:
+        library._get_for_update(book_id).key.reservation_heap.cancel(patron_id)
+        library._release(patron_id, book_id, borrowed=False)
+    return book_ids
+
+
+def _query_stats(library):
+    collector = OutputCollector()
+    library.stats(collector)
+    return collector.take()
+
+
+def _query_median(library):
+    # The ID of the middle book, a good place to split the shard.
+    node = library.book_tree.select(len(library.book_tree) // 2)
+    return node.key.book_id if node else None
+
+
+def _query_split(library, book_id, path):
+    # Moves the books from book_id up into a snapshot at path, for a new shard to load.
+    save_snapshot(library.split_off(book_id), path)
+
+
+QUERIES = {
+    "range": _query_range,
+    "page": _query_page,
+    "count": lambda library, book_id1, book_id2: library.book_tree.count_range(book_id1, book_id2),
+    "size": lambda library: len(library.book_tree),
+    "rank": _query_rank,
+    "select": _query_select,
+    "closest": _query_closest,
+    "nearest": _query_nearest,
+    "patron": _query_patron,
+    "cancel_all": _query_cancel_all,
+    "author": _query_author,
+    "title_prefix": _query_title_prefix,
+    "flips": lambda library: library.book_tree.get_color_flips(),
+    "stats": _query_stats,
+    "median": _query_median,
+    "split": _query_split,
+}
+
+
+def _serve_shard(connection, snapshot_path, bulk, backend):
+    # The main loop of a worker process: runs batches and answers queries until told to stop.
+    library = GatorLibrary(backend=backend)
+    if snapshot_path:
+        load_snapshot(snapshot_path, library)
+        os.remove(snapshot_path)
+    while True:
+        message = connection.recv()
+        if message[0] == "run":
+            connection.send(_run_batch(library, message[1], bulk))
+        elif message[0] == "query":
+            connection.send(QUERIES[message[1]](library, *message[2]))
+        else:
+            connection.close()
+            return
+
+
+class Shard:
+    # The router's handle on one worker process.
+    __slots__ = ("process", "connection", "pending", "outstanding", "replies")
+
+    def __init__(self, snapshot_path=None, bulk=False, backend="rbtree"):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve_shard,
+                                               args=(worker_connection, snapshot_path, bulk, backend), daemon=True)
+        self.process.start()
+        worker_connection.close()
+        self.pending = []  # Commands not yet sent.
+        self.outstanding = False  # Whether a batch has been sent but its output not yet received.
+        self.replies = []  # Output of the commands sent since the last flush, in order.
+
+    def send_pending(self):
+        # At most one batch is in flight, so that neither side can block sending while the other
+        # is blocked sending too.
+        self.receive()
+        self.connection.send(("run", self.pending))
+        self.pending = []
+        self.outstanding = True
+
+    def receive(self):
+        if self.outstanding:
+            self.replies.extend(self.connection.recv())
+            self.outstanding = False
+
+    def stop(self):
+        self.connection.send(("stop",))
+        self.process.join()
+        self.connection.close()
+
+
+class ShardedLibrary:
+    def __init__(self, boundaries=(), bulk=False, backend="rbtree"):
+        """
+        Starts one worker per range of book IDs. boundaries are the sorted IDs at which each
+        shard after the first begins; no boundaries gives a single shard. backend names the tree
+        each worker keeps its books in, as in GatorLibrary.
+        """
+        self.boundaries = sorted(boundaries)
+        self.bulk = bulk
+        self.backend = backend
+        self.shards = [Shard(bulk=bulk, backend=backend) for _ in range(len(self.boundaries) + 1)]
+        self.order = []  # The shard of each routed command whose output has not been written.
+
+    @classmethod
+    def evenly(cls, shard_count, key_space, bulk=False, backend="rbtree"):
+        # Splits book IDs from 0 to key_space into shard_count ranges of equal width.
+        return cls([key_space * i // shard_count for i in range(1, shard_count)], bulk, backend)
+
+    def shard_of(self, book_id):
+        return bisect.bisect_right(self.boundaries, book_id)
+
+    def run_commands(self, lines, output_file, source="<input>"):
+        """
+        Parses and executes commands from an iterable of lines, writing results to output_file
+        in the order the commands were read. Malformed lines are reported on stderr and skipped.
+        Returns True if a Quit command was seen.
+        """
+        for line_number, line in enumerate(lines, 1):
+            try:
+                parsed = parse_command(line)
+            except CommandError as error:
+                print(f"{source}:{line_number}: {error}", file=sys.stderr)
+                continue
+            if parsed is None:
+                continue
+            command, arguments = parsed
+
+            position = ROUTED_COMMANDS.get(command)
+            if position is not None:
+                index = self.shard_of(arguments[position])
+                shard = self.shards[index]
+                shard.pending.append((command, arguments))
+                self.order.append(index)
+                if len(shard.pending) >= BATCH_SIZE:
+                    shard.send_pending()
+                if len(self.order) >= FLUSH_EVERY:
+                    self.flush(output_file)
+                continue
+
+            self.flush(output_file)
+            getattr(self, COMBINED_COMMANDS[command])(*arguments, output_file)
+            if command == "Quit":
+                return True
+        self.flush(output_file)
+        return False
+
+    def flush(self, output_file):
+        # Waits for every routed command so far and writes their output in order.
+        if not self.order:
+            return
+        for shard in self.shards:
+            if shard.pending:
+                shard.send_pending()
+        for shard in self.shards:
+            shard.receive()
+        replies = [iter(shard.replies) for shard in self.shards]
+        for index in self.order:
+            output_file.write(next(replies[index]))
+        for shard in self.shards:
+            shard.replies = []
+        self.order = []
+
+    def gather(self, name, *arguments, shards=None):
+        # Sends a query to each shard, by default all of them, and returns their answers in shard order.
+        shards = self.shards if shards is None else shards
+        for shard in shards:
+            shard.connection.send(("query", name, arguments))
+        return [shard.connection.recv() for shard in shards]
+
+    def split_shard(self, book_id):
+        """
+        Splits the shard holding book_id so that the books from book_id up move to a new worker.
+        Call only between commands, once everything sent has been flushed.
+        """
+        index = self.shard_of(book_id)
+        if index and self.boundaries[index - 1] == book_id:
+            return
+        descriptor, path = tempfile.mkstemp(suffix=".snap")
+        os.close(descriptor)
+        self.gather("split", book_id, path, shards=[self.shards[index]])
+        self.shards.insert(index + 1, Shard(path, self.bulk, self.backend))
+        self.boundaries.insert(index, book_id)
+
+    def split_largest(self):
+        # Splits the shard with the most books at its middle book, returning the ID split at.
+        sizes = self.gather("size")
+        index = sizes.index(max(sizes))
+        median = self.gather("median", shards=[self.shards[index]])[0]
+        if median is not None:
+            self.split_shard(median)
+        return median
+
+    def close(self):
+        for shard in self.shards:
+            shard.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _shards_between(self, book_id1, book_id2):
+        # The shards that may hold books in the range, in order.
+        return self.shards[self.shard_of(book_id1):self.shard_of(book_id2) + 1]
+
+    def print_books(self, book_id1, book_id2, output_file):
+        found = False
+        if book_id1 <= book_id2:
+            for books in self.gather("range", book_id1, book_id2, shards=self._shards_between(book_id1, book_id2)):
+                for text in books:
+                    output_file.write(text)
+                    found = True
+        if not found:
+            output_file.write(f"No books found in the range [{book_id1}, {book_id2}]")
+
+    def print_books_page(self, book_id1, book_id2, offset, limit, output_file):
+        found = False
+        offset = max(offset, 0)
+        if book_id1 <= book_id2 and limit > 0:
+            shards = self._shards_between(book_id1, book_id2)
+            for shard, count in zip(shards, self.gather("count", book_id1, book_id2, shards=shards)):
+                if offset >= count:
+                    offset -= count
+                    continue
+                books = self.gather("page", book_id1, book_id2, offset, limit, shards=[shard])[0]
+                for text in books:
+                    output_file.write(text)
+                    found = True
+                offset = 0
+                limit -= len(books)
+                if not limit:
+                    break
+        if not found:
+            output_file.write(f"No books found in the range [{book_id1}, {book_id2}]")
+
+    def count_books(self, book_id1, book_id2, output_file):
+        count = sum(self.gather("count", book_id1, book_id2)) if book_id1 <= book_id2 else 0
+        output_file.write(f"\nBooks in the range [{book_id1}, {book_id2}]: {count}\n")
+
+    def rank_of(self, book_id, output_file):
+        index = self.shard_of(book_id)
+        rank = self.gather("rank", book_id, shards=[self.shards[index]])[0]
+        if rank is not None:
+            rank += sum(self.gather("size", shards=self.shards[:index]))
+            output_file.write(f"\nBook {book_id} has rank {rank + 1}\n")
+        else:
+            output_file.write(f"Book {book_id} not found in the Library")
+
+    def select_book(self, rank, output_file):
+        index = rank - 1
+        text = None
+        if index >= 0:
+            for shard, size in zip(self.shards, self.gather("size")):
+                if index < size:
+                    text = self.gather("select", index, shards=[shard])[0]
+                    break
+                index -= size
+        if text:
+            output_file.write(text)
+        else:
+            output_file.write(f"No book with rank {rank} in the Library")
+
+    def print_patron(self, patron_id, output_file):
+        borrowed = []
+        reserved = []
+        # Shards hold increasing ranges of book IDs, so the lists come out sorted.
+        for shard_borrowed, shard_reserved in self.gather("patron", patron_id):
+            borrowed.extend(shard_borrowed)
+            reserved.extend(shard_reserved)
+        output_file.write(f"\nPatronID = {patron_id}\nBorrowed = {borrowed}\nReservations = {reserved}\n")
+
+    def cancel_all_reservations(self, patron_id, output_file):
+        book_ids = [book_id for shard_books in self.gather("cancel_all", patron_id) for book_id in shard_books]
+        if book_ids:
+            output_file.write(f"\nReservations made by Patron {patron_id} for Books {', '.join(map(str, book_ids))} have been cancelled.\n")
+        else:
+            output_file.write(f"\nPatron {patron_id} has no reservations.\n")
+
+    def find_by_author(self, author_name, output_file):
+        # Shards hold increasing ranges of book IDs, so their answers follow on in ID order.
+        found = False
+        for books in self.gather("author", author_name):
+            for text in books:
+                output_file.write(text)
+                found = True
+        if not found:
+            output_file.write(f"No books found by author \"{author_name}\"")
+
+    def find_by_title_prefix(self, prefix, output_file):
+        found = False
+        for _, text in heapq.merge(*self.gather("title_prefix", prefix)):
+            output_file.write(text)
+            found = True
+        if not found:
+            output_file.write(f"No books found with title starting with \"{prefix}\"")
+
+    def find_closest_book(self, target_id, output_file):
+        # The closest books overall are the closest books of whichever shard gets nearest.
+        candidates = [book for books in self.gather("closest", target_id) for book in books]
+        if candidates:
+            distance = min(abs(book_id - target_id) for book_id, _ in candidates)
+            for book_id, text in candidates:
+                if abs(book_id - target_id) == distance:
+                    output_file.write(text)
+        else:
+            output_file.write(f"No books found in the library.")
+
+    def find_closest_books(self, target_id, k, output_file):
+        # Each shard offers its own k nearest books; the k nearest of those, lower IDs first on
+        # ties, are the k nearest overall.
+        candidates = [book for books in self.gather("nearest", target_id, k) for book in books]
+        nearest = sorted(candidates, key=lambda book: (abs(book[0] - target_id), book[0]))[:max(k, 0)]
+        for _, text in sorted(nearest):
+            output_file.write(text)
+        if not any(self.gather("size")):
+            output_file.write(f"No books found in the library.")
+
+    def color_flip_count(self, output_file):
+        if self.backend != "rbtree":
+            output_file.write("\nColor Flip Count is only available with the rbtree backend\n")
+            return
+        output_file.write(f"\nColor Flip Count: {sum(self.gather('flips'))}\n")
+
+    def stats(self, output_file):
+        # The report of each shard in turn, headed by the range of book IDs it holds.
+        bounds = ["-inf"] + self.boundaries + ["inf"]
+        for index, text in enumerate(self.gather("stats")):
+            output_file.write(f"\nShard {index} [{bounds[index]}, {bounds[index + 1]})")
+            output_file.write(text)
+
+    def quit(self, output_file):
+        output_file.write("Program Terminated.")
+
+
+# The ShardedLibrary method that runs each command spanning more than one shard.
+COMBINED_COMMANDS = {
+    "PrintBooks": "print_books",
+    "PrintBooksPage": "print_books_page",
+    "CountBooks": "count_books",
+    "RankOf": "rank_of",
+    "SelectBook": "select_book",
+    "PrintPatron": "print_patron",
+    "CancelAllReservations": "cancel_all_reservations",
+    "FindByAuthor": "find_by_author",
+    "FindByTitlePrefix": "find_by_title_prefix",
+    "FindClosestBook": "find_closest_book",
+    "FindClosestBooks": "find_closest_books",
+    "ColorFlipCount": "color_flip_count",
+    "Stats": "stats",
+    "Quit": "quit",
+}
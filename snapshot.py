@@ -0,0 +1,176 @@
+"""
+Binary snapshots of a GatorLibrary, so that a large catalog can be restored at startup without
+replaying every command that built it. A snapshot file is laid out as follows, all little-endian:
+
+    header        magic, format version, book/string/reservation counts, the color flip count
+                  and the sequence number of the last logged command the snapshot includes
+    string pool   string_count + 1 offsets into a UTF-8 blob, followed by the blob; titles,
+                  authors and availability statuses are stored once and referred to by index
+    book table    one fixed-size record per book, sorted by book_id
+    reservations  the reservation heap of every book, stored back to back in heap order
+"""
+import gc
+import mmap
+import struct
+from library import Book, GatorLibrary, Patron
+
+MAGIC = b"GLIB"
+VERSION = 1
+# magic, version, books, strings, reservations, color flips, log sequence
+HEADER = struct.Struct("<4sHQIQQQ")
+OFFSET = struct.Struct("<Q")
+# book_id, title, author, status, has borrower, borrowed_by, first reservation, reservation count,
+# next reservation order
+BOOK = struct.Struct("<qIIIBqQIQ")
+RESERVATION = struct.Struct("<qqQ")  # patron_id, priority, order
+
+
+class SnapshotError(ValueError):
+    # Raised when a file is not a snapshot this version can read.
+    pass
+
+
+def save_snapshot(library, path, log_sequence=0):
+    """
+    Writes every book, reservation queue and the color flip count of the library to path.
+    log_sequence records the last write-ahead log entry already applied to the library.
+    """
+    strings = {}
+
+    def intern(text):
+        # Returns the index of the string in the pool, adding it if needed.
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    book_records = []
+    reservation_records = []
+    for node in library.book_tree.iter_range(float('-inf'), float('inf')):
+        book = node.key
+        heap = book._reservation_heap
+        reservations = heap.heap[1:] if heap is not None else []
+        book_records.append(BOOK.pack(
+            book.book_id, intern(book.book_name), intern(book.author_name), intern(book.availability_status),
+            book.borrowed_by is not None, book.borrowed_by if book.borrowed_by is not None else 0,
+            len(reservation_records), len(reservations), heap._next_order if heap is not None else 0))
+        reservation_records.extend(RESERVATION.pack(*reservation) for reservation in reservations)
+
+    encoded = [text.encode("utf-8") for text in strings]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(book_records), len(encoded), len(reservation_records),
+                               library.book_tree.get_color_flips() or 0, log_sequence))
+        file.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        file.write(b"".join(encoded))
+        file.write(b"".join(book_records))
+        file.write(b"".join(reservation_records))
+
+
+def load_snapshot(path, library=None):
+    """
+    Restores the books in a snapshot into library, or into a new GatorLibrary if none is given,
+    and returns it. The file is memory-mapped and the book tree is rebuilt bottom-up in linear
+    time. Any books already in the library are replaced. The rebuilt tree is balanced but may
+    have a different shape from the one that was saved, so later color flip counts can differ
+    from those of a library that replayed the original commands. The whole file is read and
+    checked before the library is changed, so a library is left as it was if SnapshotError is
+    raised.
+    """
+    if library is None:
+        library = GatorLibrary()
+    # Loading allocates millions of objects that all stay alive, so the cyclic garbage collector
+    # would only rescan them over and over; pause it until the library is built.
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path, "rb") as file:
+            # Check the header first, which also rules out an empty file that mmap cannot map.
+            _read_header(file.read(HEADER.size))
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                failure = None
+                try:
+                    _load(view, library)
+                except (ValueError, IndexError, struct.error) as error:
+                    # Keep only the message: the traceback holds slices of the mapping, which must
+                    # all be gone before the mapping can be closed.
+                    failure = str(error)
+                view.release()
+    finally:
+        if collecting:
+            gc.enable()
+    if failure is not None:
+        raise SnapshotError(failure)
+    return library
+
+
+def snapshot_log_sequence(path):
+    # Returns the log sequence number stored in a snapshot, reading only its header.
+    with open(path, "rb") as file:
+        header = _read_header(file.read(HEADER.size))
+    return header[-1]
+
+
+def _read_header(data):
+    # Unpacks and checks a snapshot header, returning the fields after the magic and version.
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        raise SnapshotError("not a GatorLibrary snapshot")
+    fields = HEADER.unpack_from(data)
+    if fields[1] != VERSION:
+        raise SnapshotError(f"unsupported snapshot version {fields[1]}")
+    return fields[2:]
+
+
+def _load(view, library):
+    # Reads a snapshot from a buffer into library, changing the library only once it has all been read.
+    book_count, string_count, reservation_count, color_flips, _ = _read_header(bytes(view[:HEADER.size]))
+    position = HEADER.size
+
+    offset_table, position = _take(view, position, OFFSET.size * (string_count + 1))
+    offsets = [offset for offset, in OFFSET.iter_unpack(offset_table)]
+    blob, position = _take(view, position, offsets[-1])
+    strings = [str(blob[start:end], "utf-8") for start, end in zip(offsets, offsets[1:])]
+    book_table, position = _take(view, position, BOOK.size * book_count)
+    reservation_table, position = _take(view, position, RESERVATION.size * reservation_count)
+    reservations = list(RESERVATION.iter_unpack(reservation_table))
+
+    books = []
+    patrons = {}
+
+    def patron(patron_id):
+        entry = patrons.get(patron_id)
+        if entry is None:
+            entry = patrons[patron_id] = Patron()
+        return entry
+
+    for (book_id, title, author, status, has_borrower, borrowed_by,
+         first_reservation, reservation_total, next_order) in BOOK.iter_unpack(book_table):
+        book = Book(book_id, strings[title], strings[author], strings[status])
+        if has_borrower:
+            book.borrowed_by = borrowed_by
+            patron(borrowed_by).borrowed.add(book_id)
+        if reservation_total:
+            heap = book.reservation_heap
+            # The entries were saved in heap order, so heapify only has to verify them.
+            heap.heapify(reservations[first_reservation:first_reservation + reservation_total])
+            heap._next_order = max(heap._next_order, next_order)
+            for reservation in reservations[first_reservation:first_reservation + reservation_total]:
+                patron(reservation[0]).reserved.add(book_id)
+        books.append(book)
+
+    library.patrons = patrons
+    library.book_tree.bulk_load(books)
+    if library.book_tree.get_color_flips() is not None:
+        library.book_tree.color_flips = color_flips
+    library.rebuild_indexes()
+
+
+def _take(view, position, size):
+    # Returns the next size bytes of the buffer and the position after them.
+    if position + size > len(view):
+        raise SnapshotError("snapshot is truncated")
+    return view[position:position + size], position + size
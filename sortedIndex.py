@@ -0,0 +1,164 @@
+import bisect
+
+# Buckets are split in two once they hold twice this many entries.
+BUCKET_SIZE = 512
+
+
+class SortedIndex:
+    """
+    A secondary index from a text field of a book, such as its title, to the books themselves.
+    It keeps (text, book_id, book) entries in sorted order, so all the books whose text starts
+    with a given prefix sit next to each other and are found by binary search in O(log n + k).
+    Book IDs are unique, so entries never tie on (text, book_id) and books are never compared.
+    The entries are split across buckets of at most 2 * BUCKET_SIZE sorted entries, with the
+    last entry of each bucket kept in a separate list, so adding or removing an entry only
+    shifts one small bucket rather than the whole index.
+
+    New entries are only appended to a pending list, and are sorted into the buckets the next
+    time the index is read or an entry is removed or replaced. Adding an entry therefore costs
+    O(1), and a run of inserts is merged in one go.
+    """
+    __slots__ = ("buckets", "maxes", "pending", "size")
+
+    def __init__(self):
+        self.buckets = []  # Sorted lists of (text, book_id, book) entries, in order.
+        self.maxes = []  # The last entry of each bucket.
+        self.pending = []  # Entries added since the buckets were last brought up to date.
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        self._flush()
+        for bucket in self.buckets:
+            yield from bucket
+
+    def add(self, text, book_id, book):
+        self.pending.append((text, book_id, book))
+        self.size += 1
+
+    def add_many(self, entries):
+        # Adds many (text, book_id, book) entries at once.
+        count = len(self.pending)
+        self.pending.extend(entries)
+        self.size += len(self.pending) - count
+
+    def _flush(self):
+        # Sorts the pending entries into the buckets.
+        if not self.pending:
+            return
+        entries = self.pending
+        self.pending = []
+        # Merging rebuilds the list of buckets, so a few entries are cheaper to insert one by one.
+        if len(entries) < len(self.buckets):
+            for entry in entries:
+                self._insert(entry)
+        else:
+            self._merge(entries)
+
+    def _insert(self, entry):
+        if not self.buckets:
+            self.buckets.append([entry])
+            self.maxes.append(entry)
+            return
+        # The first bucket whose last entry is not less than the new one, or the last bucket.
+        idx = min(bisect.bisect_left(self.maxes, entry), len(self.buckets) - 1)
+        bucket = self.buckets[idx]
+        bisect.insort(bucket, entry)
+        self.maxes[idx] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self.buckets[idx:idx + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self.maxes[idx:idx + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+
+    def _merge(self, entries):
+        """
+        Merges many entries into the buckets. The batch is sorted and each bucket is merged with
+        the entries that belong in it, so this takes O(m log m) for m entries, plus time linear
+        in the buckets they land in and the number of buckets, rather than re-sorting the index.
+        """
+        entries.sort()
+        buckets = []
+        maxes = []
+        start = 0
+        last = len(self.buckets) - 1
+        for idx, bucket in enumerate(self.buckets or [[]]):
+            # The new entries up to this bucket's last entry, or all the rest for the last bucket.
+            stop = len(entries) if idx >= last else bisect.bisect_right(entries, self.maxes[idx], start)
+            if stop > start:
+                # Both lists are sorted, so sorting them together is a linear merge.
+                bucket = bucket + entries[start:stop]
+                bucket.sort()
+                start = stop
+            if len(bucket) > 2 * BUCKET_SIZE:
+                for cut in range(0, len(bucket), BUCKET_SIZE):
+                    buckets.append(bucket[cut:cut + BUCKET_SIZE])
+                    maxes.append(buckets[-1][-1])
+            else:
+                buckets.append(bucket)
+                maxes.append(bucket[-1])
+        self.buckets = buckets
+        self.maxes = maxes
+
+    def _find(self, text, book_id):
+        # returns the bucket index and position of the entry for (text, book_id), or None.
+        self._flush()
+        key = (text, book_id)
+        idx = bisect.bisect_left(self.maxes, key)
+        if idx == len(self.buckets):
+            return None
+        bucket = self.buckets[idx]
+        position = bisect.bisect_left(bucket, key)
+        if position == len(bucket) or bucket[position][0] != text or bucket[position][1] != book_id:
+            return None
+        return idx, position
+
+    def replace(self, text, book_id, book):
+        # Points the entry for (text, book_id) at a new book, such as a copy of the old one.
+        found = self._find(text, book_id)
+        if found is None:
+            return
+        idx, position = found
+        bucket = self.buckets[idx]
+        bucket[position] = (text, book_id, book)
+        if position == len(bucket) - 1:
+            self.maxes[idx] = bucket[position]
+
+    def remove(self, text, book_id):
+        found = self._find(text, book_id)
+        if found is None:
+            return
+        idx, position = found
+        bucket = self.buckets[idx]
+        del bucket[position]
+        self.size -= 1
+        if bucket:
+            self.maxes[idx] = bucket[-1]
+        else:
+            del self.buckets[idx]
+            del self.maxes[idx]
+
+    def clear(self):
+        self.buckets = []
+        self.maxes = []
+        self.pending = []
+        self.size = 0
+
+    def _iter_from(self, entry):
+        # yields every entry from the first one not less than entry onwards.
+        self._flush()
+        idx = bisect.bisect_left(self.maxes, entry)
+        if idx == len(self.buckets):
+            return
+        buckets = self.buckets
+        bucket = buckets[idx]
+        yield from bucket[bisect.bisect_left(bucket, entry):]
+        for idx in range(idx + 1, len(buckets)):
+            yield from buckets[idx]
+
+    def iter_prefix(self, prefix):
+        # yields (text, book_id, book) for the books whose text starts with prefix, in order of text and then ID.
+        for entry in self._iter_from((prefix, float('-inf'))):
+            if not entry[0].startswith(prefix):
+                return
+            yield entry
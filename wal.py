@@ -0,0 +1,126 @@
+"""
+A write-ahead log of the commands that change a GatorLibrary, so that a crash loses at most the
+last uncommitted group of commands. Each mutating command is appended to the log, with a sequence
+number, before it runs. Entries are fsynced in groups to spread the cost of the sync. Every so
+often the whole library is written to a snapshot that records the last sequence number it
+includes, and the log is truncated. Recovery loads the snapshot and replays only the log entries
+after that sequence number.
+"""
+import os
+from library import run_commands
+from snapshot import load_snapshot, save_snapshot, snapshot_log_sequence
+
+LOG_NAME = "commands.log"
+CHECKPOINT_NAME = "checkpoint.snap"
+
+
+class WriteAheadLog:
+    def __init__(self, library, directory, group_size=64, checkpoint_every=100000):
+        """
+        Logs commands for library into directory. Entries are synced to disk after every
+        group_size commands, and a checkpoint is taken after every checkpoint_every commands.
+        """
+        self.library = library
+        self.directory = directory
+        self.group_size = group_size
+        self.checkpoint_every = checkpoint_every
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_NAME)
+        self.sequence = 0  # Sequence number of the last command logged.
+        self.uncommitted = 0  # Entries written since the last sync.
+        self.since_checkpoint = 0  # Entries logged since the last checkpoint.
+        self.log_file = None
+
+    def recover(self):
+        """
+        Restores the library from the last checkpoint and the log entries written after it,
+        then opens the log for new entries. Returns the number of commands replayed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.checkpoint_path):
+            load_snapshot(self.checkpoint_path, self.library)
+            self.sequence = snapshot_log_sequence(self.checkpoint_path)
+
+        replay = []
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r", encoding="utf-8") as file:
+                for entry in file:
+                    if not entry.endswith("\n"):
+                        # A torn write from a crash in the middle of an entry was never committed.
+                        break
+                    sequence, _, line = entry.partition(" ")
+                    # Entries at or before the checkpoint are already in the snapshot; they are only
+                    # present if a crash came between writing the snapshot and truncating the log.
+                    if int(sequence) > self.sequence:
+                        replay.append(line)
+                        self.sequence = int(sequence)
+
+        with open(os.devnull, "w") as discard:
+            run_commands(self.library, replay, discard, self.log_path)
+        self.since_checkpoint = len(replay)
+        # Rewrite the log with just the replayed entries so that any torn tail is dropped.
+        self._rewrite_log(replay, self.sequence - len(replay))
+        return len(replay)
+
+    def append(self, line):
+        # Logs a command before it runs, syncing the log once a full group has built up.
+        self.sequence += 1
+        self.log_file.write(f"{self.sequence} {line.strip()}\n")
+        self.uncommitted += 1
+        self.since_checkpoint += 1
+        if self.uncommitted >= self.group_size:
+            self.commit()
+
+    def commit(self):
+        # Makes every entry written so far durable.
+        if self.uncommitted:
+            self.log_file.flush()
+            os.fsync(self.log_file.fileno())
+            self.uncommitted = 0
+
+    def maybe_checkpoint(self):
+        # Takes a checkpoint if enough commands have been logged. Call only once every logged
+        # command has been applied to the library.
+        if self.since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # Saves the whole library to a new snapshot, then starts an empty log.
+        self.commit()
+        temporary_path = self.checkpoint_path + ".tmp"
+        save_snapshot(self.library, temporary_path, self.sequence)
+        with open(temporary_path, "rb") as file:
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+        self._sync_directory()
+        self._rewrite_log([], self.sequence)
+        self.since_checkpoint = 0
+
+    def close(self):
+        if self.log_file:
+            self.commit()
+            self.log_file.close()
+            self.log_file = None
+
+    def _rewrite_log(self, lines, first_sequence):
+        # Atomically replaces the log with the given commands, numbered after first_sequence.
+        if self.log_file:
+            self.log_file.close()
+        temporary_path = self.log_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            for offset, line in enumerate(lines, 1):
+                file.write(f"{first_sequence + offset} {line.strip()}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.log_path)
+        self._sync_directory()
+        self.log_file = open(self.log_path, "a", encoding="utf-8")
+
+    def _sync_directory(self):
+        # Makes renames within the log directory durable.
+        if hasattr(os, "O_DIRECTORY"):
+            descriptor = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
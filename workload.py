@@ -0,0 +1,149 @@
+"""
+A seeded generator of synthetic GatorLibrary workloads. A workload is a catalog of books, inserted
+in ID order, followed by a random mix of commands. The same arguments always give the same lines.
+
+Catalog book i has ID 2 * i, so new books can be inserted between existing ones. Books are chosen
+either uniformly or by a Zipfian popularity, where the r-th most popular book is chosen with
+probability proportional to 1 / r ** exponent. Popularity ranks are scattered over the catalog,
+so the popular books are not all neighbours. Returns are drawn from the borrows issued earlier,
+so that most of them succeed.
+
+Write a workload to a file with, for example,
+'python workload.py --catalog 1000000 --commands 1000000 --zipf 1.1 > workload.txt'.
+"""
+import argparse
+import math
+import random
+import sys
+
+# Relative weights of each kind of command.
+DEFAULT_MIX = {
+    "insert": 10,
+    "borrow": 30,
+    "return": 25,
+    "delete": 5,
+    "print": 10,
+    "range": 10,
+    "closest": 10,
+}
+RANGE_WIDTH = 20  # Width in IDs of each PrintBooks range, about 10 catalog books.
+MAX_OUTSTANDING = 1 << 16  # Borrows remembered for later returns.
+
+
+class Popularity:
+    # Draws catalog indices from 0 to n - 1, uniformly or with a Zipfian distribution.
+    def __init__(self, n, rng, exponent=None):
+        self.n = n
+        self.rng = rng
+        self.exponent = exponent
+        # A stride coprime with n maps popularity ranks to catalog indices one to one.
+        self.stride = max(1, int(n * 0.6180339887))
+        while math.gcd(self.stride, n) != 1:
+            self.stride += 1
+
+    def sample(self):
+        if self.exponent is None:
+            return self.rng.randrange(self.n)
+        # Inverts the continuous approximation of the Zipf distribution's CDF, which needs
+        # no table and so works for catalogs of any size.
+        u = self.rng.random()
+        s = self.exponent
+        if s == 1:
+            x = (self.n + 1) ** u
+        else:
+            x = (((self.n + 1) ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))
+        rank = min(int(x) - 1, self.n - 1)
+        return rank * self.stride % self.n
+
+
+def parse_mix(text):
+    # Parses 'insert=10,borrow=30,...' into a mix; commands that are left out get no weight.
+    mix = dict.fromkeys(DEFAULT_MIX, 0)
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in mix:
+            raise ValueError(f"unknown command kind '{name.strip()}'")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def catalog_lines(catalog, authors=1000):
+    # The InsertBook commands that fill the catalog, in ID order.
+    for index in range(catalog):
+        book_id = 2 * index
+        yield f'InsertBook({book_id}, "Title {book_id}", "Author {index % authors}", "Yes")\n'
+
+
+def command_lines(seed, commands, catalog, mix=None, exponent=None, patrons=1000):
+    """
+    Yields commands random commands against a catalog of the given size, drawn from mix, a dict
+    of relative weights for each kind of command (see DEFAULT_MIX). exponent selects Zipfian
+    popularity with that exponent; None chooses books uniformly.
+    """
+    rng = random.Random(seed)
+    popularity = Popularity(catalog, rng, exponent)
+    mix = mix or DEFAULT_MIX
+    kinds = [kind for kind in mix if mix[kind] > 0]
+    weights = [mix[kind] for kind in kinds]
+    borrowed = []  # (patron_id, book_id) pairs from earlier borrows.
+    batch = []
+    while commands > 0:
+        if not batch:
+            batch = rng.choices(kinds, weights, k=min(commands, 4096))
+            batch.reverse()
+        kind = batch.pop()
+        commands -= 1
+        book_id = 2 * popularity.sample()
+        if kind == "insert":
+            yield f'InsertBook({book_id + 1}, "Title {book_id + 1}", "Author {book_id % 1000}", "Yes")\n'
+        elif kind == "borrow":
+            patron_id = rng.randint(1, patrons)
+            if len(borrowed) < MAX_OUTSTANDING:
+                borrowed.append((patron_id, book_id))
+            yield f"BorrowBook({patron_id}, {book_id}, {rng.randint(1, 20)})\n"
+        elif kind == "return":
+            if borrowed:
+                # Swap a random earlier borrow to the end and take it.
+                index = rng.randrange(len(borrowed))
+                borrowed[index], borrowed[-1] = borrowed[-1], borrowed[index]
+                patron_id, book_id = borrowed.pop()
+            else:
+                patron_id = rng.randint(1, patrons)
+            yield f"ReturnBook({patron_id}, {book_id})\n"
+        elif kind == "delete":
+            yield f"DeleteBook({book_id})\n"
+        elif kind == "print":
+            yield f"PrintBook({book_id})\n"
+        elif kind == "range":
+            yield f"PrintBooks({book_id}, {book_id + RANGE_WIDTH})\n"
+        else:
+            yield f"FindClosestBook({book_id + rng.randint(-3, 3)})\n"
+
+
+def generate(seed, commands, catalog, mix=None, exponent=None, patrons=1000):
+    # The whole workload: the catalog followed by the commands.
+    yield from catalog_lines(catalog)
+    yield from command_lines(seed, commands, catalog, mix, exponent, patrons)
+
+
+def add_arguments(parser):
+    # The workload options, shared with the benchmark harness.
+    parser.add_argument("--commands", type=int, default=10 ** 5, help="commands after the catalog is loaded")
+    parser.add_argument("--zipf", type=float, metavar="EXPONENT",
+                        help="choose books with Zipfian popularity instead of uniformly")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="relative weights, e.g. 'insert=10,borrow=30,return=25,delete=5,print=10,range=10,closest=10'")
+    parser.add_argument("--patrons", type=int, default=1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic GatorLibrary workload to standard output.")
+    parser.add_argument("--catalog", type=int, default=10 ** 5, help="books inserted before the commands")
+    parser.add_argument("--seed", type=int, default=1)
+    add_arguments(parser)
+    args = parser.parse_args()
+    sys.stdout.writelines(generate(args.seed, args.commands, args.catalog, args.mix, args.zipf, args.patrons))
+
+
+if __name__ == "__main__":
+    main()